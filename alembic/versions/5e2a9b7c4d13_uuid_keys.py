@@ -0,0 +1,95 @@
+"""UUID keys, drop dead columns
+
+Revision ID: 5e2a9b7c4d13
+Revises: 8c1d4e7f2a90
+Create Date: 2026-10-18 13:52:06.331870
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2a9b7c4d13"
+down_revision: Union[str, None] = "8c1d4e7f2a90"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Внешний ключ мешает сменить тип связанных столбцов, пересоздаём его после
+    op.drop_constraint(
+        "refresh_tokens_user_id_fkey", "refresh_tokens", type_="foreignkey"
+    )
+    op.alter_column(
+        "users",
+        "id",
+        existing_type=sa.String(length=36),
+        type_=sa.Uuid(),
+        postgresql_using="id::uuid",
+    )
+    op.alter_column(
+        "refresh_tokens",
+        "user_id",
+        existing_type=sa.String(length=36),
+        type_=sa.Uuid(),
+        postgresql_using="user_id::uuid",
+    )
+    op.create_foreign_key(
+        "refresh_tokens_user_id_fkey",
+        "refresh_tokens",
+        "users",
+        ["user_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
+    # Токены хранятся в refresh_tokens, коды подтверждения — в verification_store
+    op.drop_column("users", "access_token")
+    op.drop_column("users", "refresh_token")
+    op.drop_table("verification")
+
+
+def downgrade() -> None:
+    op.create_table(
+        "verification",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("email", sa.String(length=250), nullable=False),
+        sa.Column("verification_code", sa.Integer(), nullable=True),
+        sa.Column("email_confirmation", sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("email"),
+    )
+    op.add_column(
+        "users", sa.Column("refresh_token", sa.String(length=250), nullable=True)
+    )
+    op.add_column(
+        "users", sa.Column("access_token", sa.String(length=250), nullable=True)
+    )
+    op.drop_constraint(
+        "refresh_tokens_user_id_fkey", "refresh_tokens", type_="foreignkey"
+    )
+    op.alter_column(
+        "refresh_tokens",
+        "user_id",
+        existing_type=sa.Uuid(),
+        type_=sa.String(length=36),
+        postgresql_using="user_id::text",
+    )
+    op.alter_column(
+        "users",
+        "id",
+        existing_type=sa.Uuid(),
+        type_=sa.String(length=36),
+        postgresql_using="id::text",
+    )
+    op.create_foreign_key(
+        "refresh_tokens_user_id_fkey",
+        "refresh_tokens",
+        "users",
+        ["user_id"],
+        ["id"],
+        ondelete="CASCADE",
+    )
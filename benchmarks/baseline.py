@@ -0,0 +1,64 @@
+import json
+import platform
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+
+
+def save(path: Path, results: dict) -> None:
+    """
+    The save function writes benchmark results as a baseline, together with
+    a description of the machine they were measured on.
+
+    :param path: Path: Where to write the baseline
+    :param results: dict: Metric name -> {stat: value}
+    :return: None
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+        },
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+
+
+def load(path: Path) -> dict:
+    return json.loads(path.read_text())["results"]
+
+
+def compare(
+    current: dict, baseline: dict, tolerance: float, higher_is_better: set[str]
+) -> list[str]:
+    """
+    The compare function finds the stats that got worse than the baseline by more than tolerance.
+
+    :param current: dict: Metric name -> {stat: value} of this run
+    :param baseline: dict: The same structure loaded from a baseline
+    :param tolerance: float: Allowed relative change, e.g. 0.2 for 20%
+    :param higher_is_better: set[str]: Stats where a drop is a regression (e.g. rps); for all other stats a rise is
+    :return: A human-readable line per regression, empty if there are none
+    """
+    regressions = []
+    for name, stats in baseline.items():
+        if name not in current:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        for stat, expected in stats.items():
+            actual = current[name].get(stat)
+            if actual is None or not expected:
+                continue
+            change = (actual - expected) / expected
+            if stat in higher_is_better:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    f"{name} {stat}: {actual:.4g} vs baseline {expected:.4g} ({change:+.0%} worse)"
+                )
+    return regressions
@@ -0,0 +1,356 @@
+"""
+End-to-end load test for COR-Identity.
+
+Boots main:app under uvicorn against a Postgres database (migrated with alembic) and a fake
+SMTP server, seeds users, then drives a weighted mix of auth scenarios from concurrent virtual
+users and reports requests per second and p50/p95/p99 latency per endpoint.
+
+    python -m benchmarks.load_test --database-url postgresql+psycopg2://postgres@localhost/load \
+        --duration 30 --concurrency 32 --save-baseline
+    python -m benchmarks.load_test --database-url ... --compare
+
+With --compare the run exits with status 1 when an endpoint is slower (or its RPS lower) than
+the baseline by more than --tolerance, or when any request failed.
+
+SQLite cannot stand in for Postgres: signup relies on Postgres upserts and data-modifying CTEs.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+import httpx
+from aiosmtpd.controller import Controller
+
+from benchmarks import baseline
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = baseline.BASELINES_DIR / "load_test.json"
+DEFAULT_MIX = "login=30,refresh_token=25,get_all=30,signup=10,send_verification_code=5"
+PASSWORD = "load-test-1"
+
+
+class SinkHandler:
+    """aiosmtpd handler that accepts and counts every message."""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 OK"
+
+
+@contextmanager
+def fake_smtp():
+    handler = SinkHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    try:
+        yield controller, handler
+    finally:
+        controller.stop()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_env(args, smtp_port: int, log_dir: str) -> dict:
+    env = dict(os.environ)
+    env.update(
+        {
+            "SQLALCHEMY_DATABASE_URL": args.database_url,
+            "SECRET_KEY": env.get("SECRET_KEY", "load-test-secret-key-0123456789abcdef"),
+            "ALGORITHM": env.get("ALGORITHM", "HS256"),
+            "SIGNING_KEY_VERIFICATION": "false",
+            "MAIL_SERVER": "127.0.0.1",
+            "MAIL_PORT": str(smtp_port),
+            "MAIL_SSL_TLS": "false",
+            "MAIL_STARTTLS": "false",
+            "MAIL_USE_CREDENTIALS": "false",
+            "LOGIN_RATE_LIMIT_PER_EMAIL": "1000000",
+            "LOGIN_RATE_LIMIT_PER_IP": "1000000",
+            "ORIGINS_RELOAD_INTERVAL": "0",
+            # Коды в памяти видны только выдавшему их воркеру
+            "VERIFICATION_BACKEND": env.get(
+                "VERIFICATION_BACKEND", "redis" if args.workers > 1 else "memory"
+            ),
+            "LOG_FILE": os.path.join(log_dir, "server.log"),
+        }
+    )
+    return env
+
+
+def migrate(env: dict) -> None:
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"],
+        cwd=ROOT,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+@contextmanager
+def uvicorn_server(env: dict, workers: int):
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+            "--no-access-log",
+        ],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                if httpx.get(base_url + "/api/healthchecker").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not become healthy in 30s")
+            time.sleep(0.2)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+class Endpoint:
+    __slots__ = ("latencies", "errors")
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.errors = 0
+
+
+class LoadTest:
+    """
+    Virtual users, each owning a disjoint slice of the seeded accounts so that refresh token
+    rotation never races between virtual users (a reused refresh token revokes its family).
+    """
+
+    def __init__(self, client: httpx.AsyncClient, mix: dict[str, int], seed: int):
+        self.client = client
+        self.scenarios = list(mix)
+        self.weights = list(mix.values())
+        self.seed = seed
+        self.run_id = uuid.uuid4().hex[:8]
+        self.endpoints: dict[str, Endpoint] = {}
+        self._counter = 0
+
+    def _email(self) -> str:
+        self._counter += 1
+        return f"load-{self.run_id}-{self._counter}@cor-load.org"
+
+    async def _request(self, name: str, expected: int, method: str, url: str, **kwargs):
+        endpoint = self.endpoints.setdefault(name, Endpoint())
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            endpoint.errors += 1
+            return None
+        endpoint.latencies.append(time.perf_counter() - start)
+        if response.status_code != expected:
+            endpoint.errors += 1
+            return None
+        return response
+
+    async def signup(self, account=None):
+        email = self._email()
+        await self._request(
+            "signup", 201, "POST", "/api/auth/signup",
+            json={"email": email, "password": PASSWORD},
+        )
+        return email
+
+    async def login(self, account):
+        response = await self._request(
+            "login", 200, "POST", "/api/auth/login",
+            data={"username": account["email"], "password": PASSWORD},
+        )
+        if response is not None:
+            account.update(response.json())
+
+    async def refresh_token(self, account):
+        response = await self._request(
+            "refresh_token", 200, "GET", "/api/auth/refresh_token",
+            headers={"Authorization": f"Bearer {account['refresh_token']}"},
+        )
+        if response is not None:
+            account.update(response.json())
+
+    async def send_verification_code(self, account):
+        await self._request(
+            "send_verification_code", 200, "POST", "/api/auth/send_verification_code",
+            json={"email": self._email()},
+        )
+
+    async def get_all(self, account):
+        await self._request(
+            "get_all", 200, "GET", "/api/users/get_all",
+            headers={"Authorization": f"Bearer {account['access_token']}"},
+        )
+
+    async def seed_accounts(self, count: int, concurrency: int) -> list[dict]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create():
+            async with semaphore:
+                account = {"email": await self.signup()}
+                await self.login(account)
+                return account
+
+        accounts = await asyncio.gather(*(create() for _ in range(count)))
+        self.endpoints.clear()
+        missing = [account for account in accounts if "access_token" not in account]
+        if missing:
+            raise RuntimeError(f"{len(missing)} of {count} seed accounts could not log in")
+        return accounts
+
+    async def virtual_user(self, index: int, accounts: list[dict], deadline: float):
+        rng = random.Random(self.seed + index)
+        while time.monotonic() < deadline:
+            scenario = rng.choices(self.scenarios, self.weights)[0]
+            await getattr(self, scenario)(rng.choice(accounts))
+
+    async def run(self, concurrency: int, accounts: list[dict], duration: float) -> float:
+        deadline = time.monotonic() + duration
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                self.virtual_user(i, accounts[i::concurrency], deadline)
+                for i in range(concurrency)
+            )
+        )
+        return time.perf_counter() - start
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(endpoints: dict[str, Endpoint], elapsed: float) -> tuple[dict, dict]:
+    results, errors = {}, {}
+    for name, endpoint in sorted(endpoints.items()):
+        latencies = sorted(endpoint.latencies)
+        results[name] = {
+            "rps": len(latencies) / elapsed,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+        errors[name] = endpoint.errors
+    return results, errors
+
+
+def print_report(results: dict, errors: dict, elapsed: float) -> None:
+    print(f"{'endpoint':<24}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, stats in results.items():
+        print(
+            f"{name:<24}{stats['rps']:>9.1f}{stats['p50_ms']:>10.1f}"
+            f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{errors[name]:>8}"
+        )
+    total = sum(stats["rps"] for stats in results.values())
+    print(f"{'total':<24}{total:>9.1f}  over {elapsed:.1f}s")
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() not in LoadTest.__dict__:
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}")
+        mix[name.strip()] = int(weight)
+    return mix
+
+
+async def _drive(args, base_url: str) -> tuple[dict, dict, float]:
+    limits = httpx.Limits(
+        max_connections=args.concurrency, max_keepalive_connections=args.concurrency
+    )
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        test = LoadTest(client, args.mix, args.seed)
+        accounts = await test.seed_accounts(max(args.users, args.concurrency), args.concurrency)
+        if args.warmup:
+            await test.run(args.concurrency, accounts, args.warmup)
+            test.endpoints.clear()
+        elapsed = await test.run(args.concurrency, accounts, args.duration)
+        results, errors = summarize(test.endpoints, elapsed)
+        return results, errors, elapsed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load_test")
+    database_url = os.getenv("SQLALCHEMY_DATABASE_URL")
+    parser.add_argument("--database-url", default=database_url, required=not database_url)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=200, help="accounts seeded before the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--json", type=Path, help="also write this run's results here")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as log_dir, fake_smtp() as (smtp, sink):
+        env = server_env(args, smtp.port, log_dir)
+        migrate(env)
+        with uvicorn_server(env, args.workers) as base_url:
+            results, errors, elapsed = asyncio.run(_drive(args, base_url))
+
+    print_report(results, errors, elapsed)
+    print(f"fake SMTP received {sink.received} messages")
+    if args.json:
+        args.json.write_text(json.dumps({"results": results, "errors": errors}, indent=2) + "\n")
+    if args.save_baseline:
+        baseline.save(args.baseline, results)
+        print(f"baseline saved to {args.baseline}")
+
+    failed = sum(errors.values()) > 0
+    if failed:
+        print(f"FAILED: {sum(errors.values())} requests returned an unexpected status")
+    if args.compare:
+        regressions = baseline.compare(
+            results, baseline.load(args.baseline), args.tolerance, higher_is_better={"rps"}
+        )
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        failed = failed or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
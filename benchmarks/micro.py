@@ -0,0 +1,270 @@
+"""
+Micro-benchmarks for the Auth and middleware primitives on the request hot path.
+
+Each benchmark is calibrated to run for at least --round-time seconds per round and is timed
+over --rounds rounds; the report shows the per-call median, min and spread and, with a stored
+baseline, the change against it.
+
+    python -m benchmarks.micro --save-baseline
+    python -m benchmarks.micro --compare -k jwt
+
+With --compare the run exits with status 1 when a benchmark's median is slower than the
+baseline by more than --tolerance.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("SECRET_KEY", "micro-benchmark-secret-key-0123456789")
+
+from passlib.context import CryptContext  # noqa: E402
+
+from benchmarks import baseline  # noqa: E402
+from cor_auth.repository import users as repository_users  # noqa: E402,F401  (до services.auth)
+from cor_auth.middleware.signature import verify_signature  # noqa: E402
+from cor_auth.services.auth import auth_service  # noqa: E402
+from cor_auth.services.hashing import password_hasher  # noqa: E402
+from cor_auth.services.jwt_codec import JoseCodec, NativeCodec  # noqa: E402
+from cor_auth.services.keys import key_ring  # noqa: E402
+from cor_auth.services.origins import origin_policy  # noqa: E402
+from cor_auth.services.principal_cache import Principal, principal_cache  # noqa: E402
+from cor_auth.database.models import Role  # noqa: E402
+
+DEFAULT_BASELINE = baseline.BASELINES_DIR / "micro.json"
+BODY_SIZES = (1024, 65536, 1048576)
+
+
+class Benchmark:
+    __slots__ = ("name", "func", "is_async", "slow")
+
+    def __init__(self, name: str, func: Callable, is_async: bool = False, slow: bool = False):
+        self.name = name
+        self.func = func
+        self.is_async = is_async
+        self.slow = slow
+
+
+def collect(bcrypt_rounds: list[int]) -> list[Benchmark]:
+    loop = asyncio.get_event_loop()
+    access_token = loop.run_until_complete(
+        auth_service.create_access_token(data={"oid": "bench-user"})
+    )
+    refresh_token = loop.run_until_complete(auth_service.create_refresh_token())
+    principal_cache.put(Principal("bench-user", "bench@cor-load.org", Role.user))
+
+    origin_policy.reload(
+        [f"https://tenant{i}.cor-medical.ua" for i in range(500)]
+        + [f"https://*.region{i}.cor-medical.ua" for i in range(50)]
+    )
+
+    benchmarks = [
+        Benchmark(
+            "create_access_token",
+            lambda: auth_service.create_access_token(data={"oid": "bench-user"}),
+            is_async=True,
+        ),
+        Benchmark("create_refresh_token", auth_service.create_refresh_token, is_async=True),
+        Benchmark(
+            "decode_refresh_token",
+            lambda: auth_service.decode_refresh_token(refresh_token),
+            is_async=True,
+        ),
+        Benchmark(
+            "get_current_user (jwt decode, cached principal)",
+            lambda: auth_service.get_current_user(access_token, None),
+            is_async=True,
+        ),
+        Benchmark(
+            "is_valid_redirect_url exact",
+            lambda: auth_service.is_valid_redirect_url("https://tenant250.cor-medical.ua/login"),
+        ),
+        Benchmark(
+            "is_valid_redirect_url wildcard",
+            lambda: auth_service.is_valid_redirect_url("https://a.region25.cor-medical.ua/login"),
+        ),
+        Benchmark(
+            "is_valid_redirect_url rejected",
+            lambda: auth_service.is_valid_redirect_url("https://evil.example.org/login"),
+        ),
+    ]
+
+    claims = auth_service.jwt_codec.decode(access_token)
+    for codec in (NativeCodec(key_ring), JoseCodec(key_ring)):
+        benchmarks += [
+            Benchmark(f"jwt encode {codec.name}", lambda codec=codec: codec.encode(claims)),
+            Benchmark(
+                f"jwt decode {codec.name}", lambda codec=codec: codec.decode(access_token)
+            ),
+        ]
+
+    key = b"micro-benchmark-signing-key"
+    for size in BODY_SIZES:
+        body = os.urandom(size)
+        signature = hmac.new(key, body, hashlib.sha256).hexdigest()
+        benchmarks.append(
+            Benchmark(
+                f"verify_signature {size // 1024}KiB",
+                lambda body=body, signature=signature: verify_signature(body, signature, key),
+            )
+        )
+
+    hashed = loop.run_until_complete(auth_service.get_password_hash("bench-password"))
+    benchmarks += [
+        Benchmark(
+            "get_password_hash (pool)",
+            lambda: auth_service.get_password_hash("bench-password"),
+            is_async=True,
+            slow=True,
+        ),
+        Benchmark(
+            "verify_password (pool)",
+            lambda: auth_service.verify_password("bench-password", hashed),
+            is_async=True,
+            slow=True,
+        ),
+    ]
+    for rounds in bcrypt_rounds:
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        hashed_at_cost = context.hash("bench-password")
+        benchmarks += [
+            Benchmark(
+                f"bcrypt hash cost={rounds}",
+                lambda context=context: context.hash("bench-password"),
+                slow=True,
+            ),
+            Benchmark(
+                f"bcrypt verify cost={rounds}",
+                lambda context=context, hashed=hashed_at_cost: context.verify(
+                    "bench-password", hashed
+                ),
+                slow=True,
+            ),
+        ]
+    return benchmarks
+
+
+def _time(benchmark: Benchmark, number: int) -> float:
+    func = benchmark.func
+    if benchmark.is_async:
+
+        async def batch():
+            start = time.perf_counter()
+            for _ in range(number):
+                await func()
+            return time.perf_counter() - start
+
+        return asyncio.get_event_loop().run_until_complete(batch())
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def measure(benchmark: Benchmark, rounds: int, round_time: float) -> dict:
+    """
+    The measure function times one benchmark.
+    The number of calls per round is doubled until a round takes at least round_time.
+
+    :param benchmark: Benchmark: What to run
+    :param rounds: int: How many timed rounds to run
+    :param round_time: float: The minimum duration of a round in seconds
+    :return: Per-call median, mean, min and stdev in microseconds and calls per second
+    """
+    number = 1
+    while True:
+        elapsed = _time(benchmark, number)
+        if elapsed >= round_time:
+            break
+        number *= 2
+    if benchmark.slow:
+        rounds = max(3, rounds // 2)
+    per_call = [_time(benchmark, number) / number * 1e6 for _ in range(rounds)]
+    median = statistics.median(per_call)
+    return {
+        "median_us": median,
+        "mean_us": statistics.fmean(per_call),
+        "min_us": min(per_call),
+        "stdev_us": statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        "ops": 1e6 / median,
+    }
+
+
+def print_report(results: dict, reference: dict | None) -> None:
+    width = max(len(name) for name in results) + 2
+    header = f"{'benchmark':<{width}}{'median':>12}{'min':>12}{'stdev':>10}{'ops/s':>12}"
+    if reference:
+        header += f"{'baseline':>12}{'change':>9}"
+    print(header)
+    for name, stats in results.items():
+        line = (
+            f"{name:<{width}}{_format_us(stats['median_us']):>12}{_format_us(stats['min_us']):>12}"
+            f"{stats['stdev_us'] / stats['median_us']:>9.1%} {stats['ops']:>11,.0f}"
+        )
+        if reference and name in reference:
+            expected = reference[name]["median_us"]
+            line += f"{_format_us(expected):>12}{(stats['median_us'] - expected) / expected:>+9.1%}"
+        print(line)
+
+
+def _format_us(value: float) -> str:
+    if value >= 1000:
+        return f"{value / 1000:.2f} ms"
+    return f"{value:.2f} us"
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro")
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks whose name contains this")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--round-time", type=float, default=0.05)
+    parser.add_argument("--bcrypt-rounds", default="10,12", help="comma-separated bcrypt costs")
+    parser.add_argument("--skip-slow", action="store_true", help="skip the bcrypt benchmarks")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    bcrypt_rounds = [int(rounds) for rounds in args.bcrypt_rounds.split(",") if rounds]
+    try:
+        results = {}
+        for benchmark in collect(bcrypt_rounds):
+            if args.pattern and args.pattern not in benchmark.name:
+                continue
+            if args.skip_slow and benchmark.slow:
+                continue
+            results[benchmark.name] = measure(benchmark, args.rounds, args.round_time)
+    finally:
+        password_hasher.shutdown()
+
+    reference = baseline.load(args.baseline) if args.baseline.exists() else None
+    print_report(results, reference)
+    if args.save_baseline:
+        stored = dict(reference or {})
+        stored.update(
+            {name: {"median_us": stats["median_us"]} for name, stats in results.items()}
+        )
+        baseline.save(args.baseline, stored)
+        print(f"baseline saved to {args.baseline}")
+    if args.compare:
+        if reference is None:
+            print(f"no baseline at {args.baseline}")
+            return 1
+        compared = {name: stats for name, stats in reference.items() if name in results}
+        regressions = baseline.compare(results, compared, args.tolerance, higher_is_better=set())
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
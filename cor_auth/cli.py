@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from cor_auth.database.db import AsyncSessionLocal, async_engine
+from cor_auth.repository import tokens as repository_tokens
+from cor_auth.services.hashing import calibrate_argon2, calibrate_bcrypt, password_hasher
+from cor_auth.services.provisioning import FORMATS, import_users, read_rows
+
+
+async def _import_users(args) -> dict:
+    try:
+        with open(args.path, encoding="utf-8", newline="") as stream:
+            async with AsyncSessionLocal() as db:
+                return await import_users(
+                    read_rows(stream, args.format), db, chunk_size=args.chunk_size
+                )
+    finally:
+        password_hasher.shutdown()
+        await async_engine.dispose()
+
+
+async def _prune_tokens(args) -> int:
+    try:
+        async with AsyncSessionLocal() as db:
+            return await repository_tokens.prune_expired(db, args.batch_size)
+    finally:
+        await async_engine.dispose()
+
+
+def _calibrate_hashing(args) -> None:
+    target = args.target_ms / 1000
+    if args.scheme == "argon2":
+        params, elapsed = calibrate_argon2(target, args.memory_kib, args.parallelism)
+        schemes = ["argon2", "bcrypt"]
+    else:
+        params, elapsed = calibrate_bcrypt(target)
+        schemes = ["bcrypt", "argon2"]
+    print(f"# one hash takes {elapsed * 1000:.0f} ms on this machine (target {args.target_ms:.0f} ms)")
+    print(f"PASSWORD_SCHEMES={json.dumps(schemes)}")
+    for name, value in params.items():
+        print(f"{name.upper()}={value}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="cor-identity")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser(
+        "import-users", help="Create users in bulk from a CSV or NDJSON file"
+    )
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--chunk-size", type=int, default=1000)
+
+    calibrate_parser = commands.add_parser(
+        "calibrate-hashing",
+        help="Pick password hashing parameters that fit a latency budget on this machine",
+    )
+    calibrate_parser.add_argument("--scheme", choices=("argon2", "bcrypt"), default="argon2")
+    calibrate_parser.add_argument("--target-ms", type=float, default=250)
+    calibrate_parser.add_argument("--memory-kib", type=int, default=65536)
+    calibrate_parser.add_argument("--parallelism", type=int, default=4)
+
+    prune_parser = commands.add_parser(
+        "prune-tokens", help="Delete refresh token families whose token has expired"
+    )
+    prune_parser.add_argument("--batch-size", type=int, default=1000)
+
+    args = parser.parse_args(argv)
+    if args.command == "import-users":
+        args.format = args.format or args.path.rsplit(".", 1)[-1].lower()
+        if args.format not in FORMATS:
+            parser.error("cannot guess the file format, pass --format")
+        report = asyncio.run(_import_users(args))
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return 1 if report["errors"] else 0
+    if args.command == "calibrate-hashing":
+        _calibrate_hashing(args)
+    if args.command == "prune-tokens":
+        print(f"deleted {asyncio.run(_prune_tokens(args))} expired refresh tokens")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,319 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import itertools
+import time
+import uuid
+
+from sqlalchemy import Select, create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool, QueuePool
 
 from cor_auth.conf.config import settings
+from cor_auth.services import metrics, timing
+from cor_auth.services.logger import logger
+from cor_auth.services.redis_client import get_redis
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+ASYNC_DRIVERS = {"postgresql": "asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """
+    The async_database_url function swaps the driver of a database URL for its asyncio counterpart,
+    so the same SQLALCHEMY_DATABASE_URL setting serves both engines.
+
+    :param url: str: A database URL, e.g. postgresql+psycopg2://...
+    :return: The URL with an async driver, e.g. postgresql+asyncpg://...
+    """
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        return url
+    return parsed.set(drivername=f"{parsed.get_backend_name()}+{driver}").render_as_string(
+        hide_password=False
+    )
+
+
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.sqlalchemy_async_database_url or async_database_url(
+    SQLALCHEMY_DATABASE_URL
+)
+
+
+
+class PoolStats:
+    """
+    Checkout statistics of the async engine pools in this worker: how many checkouts there were,
+    how many timed out and how long callers waited for a connection.
+    """
+
+    __slots__ = ("checkouts", "timeouts", "total_wait", "max_wait")
+
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float) -> None:
+        self.checkouts += 1
+        self.total_wait += wait
+        if wait > self.max_wait:
+            self.max_wait = wait
+        metrics.DB_POOL_CHECKOUT_WAIT.observe(wait)
+        timing.record("pool", wait)
+
+    def snapshot(self, pool) -> dict:
+        stats = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+            )
+        return stats
+
+
+pool_stats = PoolStats()
+
+
+class _TimedCheckout:
+    # Время ожидания соединения: очередь пула, при необходимости новое подключение и pre-ping
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class TimedNullPool(_TimedCheckout, NullPool):
+    pass
+
+
+def engine_options(url: str, async_driver: bool, probe: bool = False) -> dict:
+    """
+    The engine_options function builds the pool arguments for create_engine / create_async_engine from settings.
+    With db_pgbouncer connections are not pooled by SQLAlchemy (PgBouncer pools them) and asyncpg
+    prepared statement caches are disabled, since PgBouncer in transaction mode cannot keep them.
+
+    :param url: str: The database URL
+    :param async_driver: bool: Whether the options are for the asyncpg engine
+    :param probe: bool: Options for the health probe engine, which keeps a single connection of its own
+    :return: Keyword arguments for the engine
+    """
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    options = {}
+    if settings.db_pgbouncer:
+        options["poolclass"] = NullPool if probe or not async_driver else TimedNullPool
+        if async_driver:
+            options["connect_args"] = {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            }
+        return options
+    if probe:
+        options.update(pool_size=1, max_overflow=0)
+    else:
+        if async_driver:
+            options["poolclass"] = TimedQueuePool
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+        )
+    options.update(
+        pool_recycle=settings.db_pool_recycle,
+        pool_pre_ping=settings.db_pool_pre_ping,
+    )
+    return options
+
+
+async_engine = create_async_engine(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    **engine_options(SQLALCHEMY_ASYNC_DATABASE_URL, async_driver=True),
+)
+# Реплики только для чтения; URL можно задавать с синхронным драйвером, как и основной
+replica_engines = [
+    create_async_engine(async_database_url(url), **engine_options(url, async_driver=True))
+    for url in settings.replica_database_urls
+]
+_replica_cycle = itertools.cycle(replica_engines)
+
+
+class RecentWrites:
+    """
+    Keys (user ids and emails) written in the last window seconds.
+    Reads of a recently written user go to the primary, so a user never reads a replica that
+    has not replayed their own write yet. The window should exceed the usual replication lag.
+    With a prefix, marks are also kept in Redis as keys with a TTL, so a user's next request
+    is pinned whichever worker or pod serves it; without one, only this process sees them.
+
+    :param window: float: How long reads stay pinned to the primary after a write, in seconds
+    :param prefix: str | None: Redis key prefix of the shared marks, None to keep them in process only
+    """
+
+    def __init__(self, window: float, prefix: str | None = None):
+        self.window = window
+        self.prefix = prefix
+        self._until: dict[str, float] = {}
+
+    async def mark(self, *keys) -> None:
+        """
+        The mark function pins reads of the given keys to the primary for the next window seconds.
+
+        :param self: Represent the instance of the class
+        :param *keys: User ids and emails that were just written; None is skipped
+        :return: None
+        """
+        if not replica_engines:
+            return
+        keys = [str(key) for key in keys if key is not None]
+        now = time.monotonic()
+        # Окно у всех ключей одинаковое, поэтому порядок вставки совпадает с порядком истечения
+        while self._until:
+            oldest = next(iter(self._until))
+            if self._until[oldest] > now:
+                break
+            del self._until[oldest]
+        for key in keys:
+            self._until.pop(key, None)
+            self._until[key] = now + self.window
+        if self.prefix is None or not keys:
+            return
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(self.prefix + key, 1, px=int(self.window * 1000))
+                await pipe.execute()
+        except Exception as e:
+            # Запись уже закоммичена; другие воркеры могут прочитать реплику, этот — нет
+            logger.error("Failed to share read-your-writes marks", exc_info=e)
+
+    async def pinned(self, *keys) -> bool:
+        """
+        The pinned function checks whether reads of any of the keys must go to the primary.
+        Marks of this process are checked in memory; shared marks cost one EXISTS round trip.
+
+        :param self: Represent the instance of the class
+        :param *keys: User ids and emails about to be read
+        :return: True if any key was written in the last window seconds, or if Redis cannot tell
+        """
+        if not replica_engines:
+            return False
+        now = time.monotonic()
+        if any(self._until.get(str(key), 0.0) > now for key in keys):
+            return True
+        if self.prefix is None or not keys:
+            return False
+        try:
+            return await get_redis().exists(*(self.prefix + str(key) for key in keys)) > 0
+        except Exception as e:
+            # Без Redis нельзя знать, была ли запись в другом воркере: читаем с основного
+            logger.warning("Failed to check read-your-writes marks", exc_info=e)
+            return True
+
+
+recent_writes = RecentWrites(
+    settings.read_your_writes_window,
+    prefix="recent-write:" if settings.read_your_writes_shared else None,
+)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to a replica and everything else to the primary:
+    flushes, INSERT/UPDATE/DELETE, SELECT ... FOR UPDATE and any read issued with
+    bind_arguments={"primary": True}. Once a session has written, its later reads also go to the
+    primary. A session keeps to one replica for its lifetime; sessions take replicas round-robin.
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, primary: bool = False, **kw):
+        if (
+            replica_engines
+            and not primary
+            and not self._flushing
+            and not self.info.get("wrote")
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        ):
+            replica = self.info.get("replica")
+            if replica is None:
+                replica = self.info["replica"] = next(_replica_cycle)
+            return replica.sync_engine
+        if not isinstance(clause, Select):
+            self.info["wrote"] = True
+        return async_engine.sync_engine
+
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    context._query_start = time.perf_counter()
+
+
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    timing.record("db", time.perf_counter() - context._query_start)
+
+
+for _engine in (async_engine, *replica_engines):
+    event.listen(_engine.sync_engine, "before_cursor_execute", _start_query_timer)
+    event.listen(_engine.sync_engine, "after_cursor_execute", _stop_query_timer)
+
+
+@metrics.sampler
+def _sample_pool():
+    pool = async_engine.pool
+    if not isinstance(pool, QueuePool):
+        return
+    metrics.DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    metrics.DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+
+# Синхронный движок для кода, который ещё не переведён на asyncio (миграции, скрипты)
+engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    **engine_options(SQLALCHEMY_DATABASE_URL, async_driver=False),
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
 # Dependency
-def get_db():
+async def get_db():
+    """
+    The get_db function opens a new async database session for the current request
+    and closes it when the request is done.
+
+    :return: An AsyncSession instance
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_sync_db():
     """
-    The get_db function opens a new database connection if there is none yet for the current application context.
-    It will also create the database tables if they don't exist yet.
+    The get_sync_db function is the blocking counterpart of get_db for code that still uses a
+    synchronous Session.
 
     :return: A sessionlocal instance
     """
@@ -1,7 +1,7 @@
 import enum
 import uuid
 
-from sqlalchemy import Column, Integer, String, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Boolean, Enum, DateTime, ForeignKey, Uuid
 from sqlalchemy.orm import declarative_base, Mapped
 from cor_auth.database.db import engine
 
@@ -17,20 +17,33 @@ class Role(enum.Enum):
 class User(Base):
     __tablename__ = "users"
 
-    id = Column(String(36), primary_key=True, default=str(uuid.uuid4()))
+    id = Column(Uuid, primary_key=True, default=uuid.uuid4)
     email = Column(String(250), unique=True, nullable=False)
     password = Column(String(250), nullable=False)
-    access_token = Column(String(250), nullable=True)
-    refresh_token = Column(String(250), nullable=True)
     role: Mapped[Enum] = Column("role", Enum(Role), default=Role.admin)
 
 
-class Verification(Base):
-    __tablename__ = "verification"
+class Bootstrap(Base):
+    __tablename__ = "bootstrap"
+
     id = Column(Integer, primary_key=True)
-    email = Column(String(250), unique=True, nullable=False)
-    verification_code = Column(Integer, default=None)
-    email_confirmation = Column(Boolean, default=False)
+    admin_claimed = Column(Boolean, nullable=False, default=False)
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    family_id = Column(String(32), primary_key=True)
+    user_id = Column(
+        Uuid,
+        ForeignKey("users.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+    token_hash = Column(String(64), unique=True, nullable=False)
+    issued_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
 
 
 # Base.metadata.create_all(bind=engine)
@@ -0,0 +1,18 @@
+from starlette.middleware.cors import CORSMiddleware
+from starlette.types import ASGIApp
+
+from cor_auth.services.origins import OriginPolicy
+
+
+class PolicyCORSMiddleware(CORSMiddleware):
+    """
+    CORSMiddleware that asks the shared OriginPolicy instead of keeping its own copy of the origins,
+    so wildcard subdomains and reloads apply to CORS the same way they apply to redirects.
+    """
+
+    def __init__(self, app: ASGIApp, policy: OriginPolicy, **kwargs) -> None:
+        super().__init__(app, allow_origins=(), **kwargs)
+        self.policy = policy
+
+    def is_allowed_origin(self, origin: str) -> bool:
+        return self.policy.allows_origin(origin)
@@ -0,0 +1,65 @@
+import random
+import time
+import typing
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from cor_auth.services import timing
+from cor_auth.services.logger import logger
+
+
+def format_server_timing(phases: dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in phases.items())
+
+
+class ServerTimingMiddleware:
+    """
+    Pure ASGI middleware that collects monotonic phase timings for each request
+    (sig, jwt, db, bcrypt, ser) and returns them with the total in a Server-Timing header.
+    A log_sample_rate share of requests is also written to the log.
+    """
+
+    def __init__(self, app: ASGIApp, enabled: bool = True, log_sample_rate: float = 0.0):
+        self.app = app
+        self.enabled = enabled
+        self.log_sample_rate = log_sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        phases, token = timing.begin()
+        start = time.perf_counter()
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start" and self.enabled:
+                phases["total"] = time.perf_counter() - start
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", format_server_timing(phases))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            timing.end(token)
+            if self.log_sample_rate and random.random() < self.log_sample_rate:
+                phases["total"] = time.perf_counter() - start
+                logger.info(
+                    "%s %s timings: %s",
+                    scope["method"],
+                    scope["path"],
+                    format_server_timing(phases),
+                )
+
+
+class TimedJSONResponse(JSONResponse):
+    """
+    JSONResponse that records the time spent rendering the body as the ser phase.
+    """
+
+    def render(self, content: typing.Any) -> bytes:
+        with timing.phase("ser"):
+            return super().render(content)
@@ -0,0 +1,91 @@
+import hashlib
+import hmac
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from cor_auth.services import timing
+
+
+def verify_signature(body: bytes, signature: str, key: bytes) -> bool:
+    """
+    The verify_signature function checks an HMAC-SHA256 hex signature of a whole body.
+
+    :param body: bytes: The raw request body
+    :param signature: str: The hex signature from the X-Signature header
+    :param key: bytes: The signing key
+    :return: True if the signature matches
+    """
+    computed_signature = hmac.new(key, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(computed_signature.encode(), signature.encode())
+
+
+class SignatureVerificationMiddleware:
+    """
+    Pure ASGI middleware that verifies the X-Signature header of every HTTP request.
+    The HMAC is fed chunk by chunk as the body streams in, and bodies over max_body_size
+    are rejected as soon as the limit is crossed. Once verified, the received messages
+    are replayed to the application unchanged.
+    """
+
+    def __init__(self, app: ASGIApp, key: bytes, max_body_size: int, enabled: bool = True):
+        self.app = app
+        self.key = key if isinstance(key, bytes) else key.encode()
+        self.max_body_size = max_body_size
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        signature = headers.get("x-signature")
+        if signature is None:
+            await self._reject(scope, receive, send, 401, "Missing signature")
+            return
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_body_size:
+            await self._reject(scope, receive, send, 413, "Request body too large")
+            return
+
+        mac = hmac.new(self.key, digestmod=hashlib.sha256)
+        messages: list[Message] = []
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] != "http.request":
+                # Клиент отключился до окончания тела запроса
+                return
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body_size:
+                await self._reject(scope, receive, send, 413, "Request body too large")
+                return
+            with timing.phase("sig"):
+                mac.update(chunk)
+            messages.append(message)
+            if not message.get("more_body", False):
+                break
+
+        with timing.phase("sig"):
+            valid = hmac.compare_digest(mac.hexdigest().encode(), signature.encode())
+        if not valid:
+            await self._reject(scope, receive, send, 401, "Invalid signature")
+            return
+
+        replay = iter(messages)
+
+        async def replay_receive() -> Message:
+            message = next(replay, None)
+            if message is not None:
+                return message
+            return await receive()
+
+        await self.app(scope, replay_receive, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, status_code: int, detail: str):
+        response = JSONResponse(status_code=status_code, content={"detail": detail})
+        await response(scope, receive, send)
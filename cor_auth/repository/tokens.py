@@ -0,0 +1,163 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_auth.conf.config import settings
+from cor_auth.database.models import RefreshToken, User
+
+
+async def create_refresh_token(
+    user_id: uuid.UUID,
+    family_id: str,
+    token_hash: str,
+    expires_at: datetime,
+    db: AsyncSession,
+) -> None:
+    """
+    The create_refresh_token function starts a new refresh token family for a user.
+
+    :param user_id: uuid.UUID: The id of the user the token belongs to
+    :param family_id: str: The id of the new token family
+    :param token_hash: str: The hash of the opaque refresh token
+    :param expires_at: datetime: When the token expires
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    db.add(
+        RefreshToken(
+            family_id=family_id,
+            user_id=user_id,
+            token_hash=token_hash,
+            issued_at=datetime.now(timezone.utc),
+            expires_at=expires_at,
+        )
+    )
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+
+
+async def rotate_refresh_token(
+    old_hash: str,
+    new_hash: str,
+    expires_at: datetime,
+    eternal_expires_at: datetime,
+    db: AsyncSession,
+) -> tuple[uuid.UUID, str] | None:
+    """
+    The rotate_refresh_token function swaps the current token of a family for a new one
+    with a single conditional UPDATE ... RETURNING. The update only matches a live,
+    unrevoked token, so of two concurrent refreshes with the same token only one wins.
+
+    :param old_hash: str: The hash of the presented refresh token
+    :param new_hash: str: The hash of the refresh token that replaces it
+    :param expires_at: datetime: The expiry of the new token
+    :param eternal_expires_at: datetime: The expiry of the new token for eternal accounts
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The user's id and email, or None if the token is not current
+    """
+    now = datetime.now(timezone.utc)
+    email = select(User.email).where(User.id == RefreshToken.user_id).scalar_subquery()
+    if settings.eternal_accounts:
+        expires_at = case(
+            (email.in_(settings.eternal_accounts), eternal_expires_at), else_=expires_at
+        )
+    stmt = (
+        update(RefreshToken)
+        .where(
+            RefreshToken.token_hash == old_hash,
+            RefreshToken.revoked_at.is_(None),
+            RefreshToken.expires_at > now,
+        )
+        .values(token_hash=new_hash, issued_at=now, expires_at=expires_at)
+        .returning(RefreshToken.user_id, email)
+    )
+    try:
+        row = (await db.execute(stmt)).first()
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise e
+    return tuple(row) if row else None
+
+
+async def get_rotated(
+    family_id: str, new_hash: str, grace_period: float, db: AsyncSession
+) -> tuple[uuid.UUID, str] | None:
+    """
+    The get_rotated function checks whether a family was rotated to new_hash within the last grace_period seconds.
+    It lets the loser of two concurrent refreshes with the same token receive the successor the winner created,
+    instead of revoking the family.
+
+    :param family_id: str: The id of the token family
+    :param new_hash: str: The hash of the successor of the presented token
+    :param grace_period: float: How many seconds after the rotation the previous token is still accepted
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The user's id and email, or None if the family was not rotated to new_hash recently
+    """
+    now = datetime.now(timezone.utc)
+    row = (
+        await db.execute(
+            select(RefreshToken.user_id, User.email)
+            .join(User, User.id == RefreshToken.user_id)
+            .where(
+                RefreshToken.family_id == family_id,
+                RefreshToken.token_hash == new_hash,
+                RefreshToken.revoked_at.is_(None),
+                RefreshToken.expires_at > now,
+                RefreshToken.issued_at > now - timedelta(seconds=grace_period),
+            ),
+            bind_arguments={"primary": True},
+        )
+    ).first()
+    return tuple(row) if row else None
+
+
+async def revoke_family(family_id: str, db: AsyncSession) -> None:
+    """
+    The revoke_family function revokes every token of a family.
+    It is called when a token that is no longer current is presented, which means it was stolen or replayed.
+
+    :param family_id: str: The id of the token family
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    """
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+    )
+    await db.commit()
+
+
+
+async def prune_expired(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    The prune_expired function deletes refresh token families whose current token has expired.
+    Such rows can no longer be rotated, and presenting one only revokes a family that is already dead.
+    Rows are deleted in batches, each in its own transaction, so the table is never locked for long.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: The number of rows deleted per statement
+    :return: The number of rows deleted
+    """
+    now = datetime.now(timezone.utc)
+    expired = (
+        select(RefreshToken.family_id)
+        .where(RefreshToken.expires_at < now)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    total = 0
+    while True:
+        result = await db.execute(
+            delete(RefreshToken).where(RefreshToken.family_id.in_(expired))
+        )
+        await db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
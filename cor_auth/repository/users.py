@@ -1,96 +1,250 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 import uuid
 
-from cor_auth.database.models import User, Role, Verification
+from cor_auth.database.db import recent_writes
+from cor_auth.database.models import Bootstrap, User, Role
 from cor_auth.schemas import UserModel
-from sqlalchemy import func
+from sqlalchemy import exists, select, update
+from sqlalchemy.dialects.postgresql import insert
 from cor_auth.services.auth import auth_service
 from cor_auth.services.logger import logger
+from cor_auth.services.principal_cache import principal_cache
 
+DEFAULT_ROLE = Role.user
 
-async def get_user_by_email(email: str, db: Session) -> User | None:
+# Флаг bootstrap, однажды занятый, больше не освобождается: после этого запрос на его захват не нужен
+_admin_claimed = False
+
+
+def _parse_uuid(value) -> uuid.UUID | None:
+    # oid из токена приходит строкой; строка не в формате UUID не может быть id пользователя
+    if isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def get_user_by_email(email: str, db: AsyncSession, primary: bool = False) -> User | None:
     """
     The get_user_by_email function takes in an email and a database session,
     then returns the user with that email.
+    The read goes to a replica unless primary is set or the user was written in the last few seconds.
 
     :param email: str: Pass in the email of the user that we want to get
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
+    :param primary: bool: Read from the primary, e.g. before modifying the user
     :return: The first user found with the email specified
     """
-    return db.query(User).filter(User.email == email).first()
+    result = await db.execute(
+        select(User).where(User.email == email),
+        bind_arguments={"primary": primary or await recent_writes.pinned(email)},
+    )
+    return result.scalars().first()
 
 
-async def get_user_by_uuid(uuid: str, db: Session) -> User | None:
+async def get_user_by_uuid(uuid: str, db: AsyncSession) -> User | None:
     """
     The get_user_by_uuid function takes in an uuid and a database session,
     then returns the user with that uuid.
 
     :param uuid: str: Pass in the uuid of the user that we want to get
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: The first user found with the uuid specified
     """
-    return db.query(User).filter(User.id == uuid).first()
+    user_id = _parse_uuid(uuid)
+    if user_id is None:
+        return None
+    result = await db.execute(
+        select(User).where(User.id == user_id),
+        bind_arguments={"primary": await recent_writes.pinned(user_id)},
+    )
+    return result.scalars().first()
+
+
+async def get_users_by_uuids(uuids: list[str], db: AsyncSession) -> list[User]:
+    """
+    The get_users_by_uuids function returns the users with the given uuids in one query.
+
+    :param uuids: list[str]: The uuids of the users that we want to get
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The users found; unknown uuids are skipped
+    """
+    ids = [user_id for user_id in map(_parse_uuid, uuids) if user_id is not None]
+    if not ids:
+        return []
+    result = await db.execute(
+        select(User).where(User.id.in_(ids)),
+        bind_arguments={"primary": await recent_writes.pinned(*ids)},
+    )
+    return list(result.scalars().all())
 
 
-async def create_user(body: UserModel, db: Session) -> User:
+async def create_user(body: UserModel, db: AsyncSession) -> User | None:
     """
     The create_user function creates a new user in the database.
         Args:
             body (UserModel): The UserModel object containing the information to be added to the database.
-            db (Session): The SQLAlchemy Session object used for querying and updating data in the database.
+            db (AsyncSession): The SQLAlchemy AsyncSession object used for querying and updating data in the database.
         Returns:
-            User: A User object representing a newly created user.
+            User | None: A User object representing a newly created user.
+        The user is written with a single INSERT ... ON CONFLICT (email) DO NOTHING RETURNING.
+        The first account ever created becomes an administrator: only when the insert succeeded,
+        the one-row bootstrap flag is claimed in the same transaction, so the check costs O(1)
+        no matter how many users there are and a duplicate email never uses the flag up.
 
     :param body: UserModel: Pass the data from the request body into our create_user function
-    :param db: Session: Create a database session
-    :return: A user object
+    :param db: AsyncSession: Create a database session
+    :return: A user object, or None if the email already exists
     """
+    stmt = (
+        insert(User)
+        .values(
+            id=uuid.uuid4(),
+            email=body.email,
+            password=body.password,
+            role=DEFAULT_ROLE,
+        )
+        .on_conflict_do_nothing(index_elements=[User.email])
+        .returning(User)
+    )
+    try:
+        new_user = await db.scalar(stmt)
+        if new_user is not None and await claim_admin(new_user.id, db):
+            await db.refresh(new_user, attribute_names=["role"])
+        await db.commit()
+        await recent_writes.mark(body.email, new_user.id if new_user is not None else None)
+        return new_user
+    except Exception as e:
+        await db.rollback()
+        raise e
 
-    new_user = User(**body.model_dump())
-    new_user.id = str(uuid.uuid4())
-    new_user.role = Role.user
 
-    users_count = db.query(func.count(User.id)).scalar()
+async def claim_admin(user_id: uuid.UUID | None, db: AsyncSession) -> bool:
+    """
+    The claim_admin function takes the bootstrap flag if it is still free and makes the given user the administrator.
+    The flag is claimed and the role set in one UPDATE; the caller commits both together with the insert.
+    Concurrent claims serialize on the bootstrap row, so exactly one transaction wins.
 
-    if users_count == 0:
-        new_user.role = Role.admin
+    :param user_id: uuid.UUID | None: A user inserted in the current transaction, None to only take the flag
+    :param db: AsyncSession: Pass the database session to the function
+    :return: True if the flag was free and is now claimed by this transaction
+    """
+    global _admin_claimed
+    if _admin_claimed:
+        return False
+    claim = (
+        update(Bootstrap)
+        .where(Bootstrap.id == 1, Bootstrap.admin_claimed.is_(False))
+        .values(admin_claimed=True)
+        .returning(Bootstrap.id)
+    )
+    if user_id is None:
+        claimed = await db.scalar(claim)
+    else:
+        claim = claim.cte("claim")
+        claimed = await db.scalar(
+            update(User)
+            .add_cte(claim)
+            .where(User.id == user_id, exists(select(claim.c.id)))
+            .values(role=Role.admin)
+            .returning(User.id)
+            .execution_options(synchronize_session=False)
+        )
+    if claimed is None:
+        _admin_claimed = True
+        return False
+    return True
+
+
+async def bulk_create_users(rows: list[dict], db: AsyncSession) -> set[str]:
+    """
+    The bulk_create_users function inserts many users with one executemany INSERT ... ON CONFLICT (email) DO NOTHING
+    and commits them as one transaction.
+    The bootstrap flag follows create_user's rule: while it is free, an imported administrator claims it,
+    or else the first inserted user without an explicit role is promoted and claims it, in the same transaction.
+        Args:
+            rows (list[dict]): Dicts with email, password (already hashed) and optionally role.
+
+    :param rows: list[dict]: The users to insert
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The emails that were actually inserted; the others already existed
+    """
+    if not rows:
+        return set()
+    values = [
+        {
+            "id": uuid.uuid4(),
+            "email": row["email"],
+            "password": row["password"],
+            "role": row.get("role") or DEFAULT_ROLE,
+        }
+        for row in rows
+    ]
+    explicit_role = {row["email"] for row in rows if row.get("role")}
+    # Без sort_by_parameter_order вставка остаётся одним пакетным запросом; порядок берём из входных строк
+    stmt = (
+        insert(User)
+        .on_conflict_do_nothing(index_elements=[User.email])
+        .returning(User.email)
+    )
     try:
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        return new_user
+        created = set(await db.scalars(stmt, values))
+        inserted = [row for row in values if row["email"] in created]
+        if any(row["role"] == Role.admin for row in inserted):
+            await claim_admin(None, db)
+        else:
+            candidate = next(
+                (row for row in inserted if row["email"] not in explicit_role), None
+            )
+            if candidate is not None:
+                await claim_admin(candidate["id"], db)
+        await db.commit()
+        await recent_writes.mark(*created)
+        return created
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-async def update_token(user: User, token: str | None, db: Session) -> None:
+async def get_users(after: uuid.UUID | None, limit: int, db: AsyncSession) -> list[User]:
     """
-    The update_token function updates the refresh token for a user.
+    The get_users function returns a page of users ordered by id.
+    Pages are addressed by keyset: the next page starts right after the last id of the previous one,
+    so deep pages cost the same as the first one. Pages are read from a replica when one is configured.
 
-    :param user: User: Identify the user that is being updated
-    :param token: str | None: Pass the token to the function
-    :param db: Session: Commit the changes to the database
-    :return: None, so the return type should be none
+    :param after: uuid.UUID | None: The id of the last user of the previous page, None for the first page
+    :param limit: int: Limit the number of results returned
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A list of users
     """
-    user.refresh_token = token
-    db.commit()
+    stmt = select(User).order_by(User.id).limit(limit)
+    if after is not None:
+        stmt = stmt.where(User.id > after)
+    result = await db.execute(stmt)
+    return list(result.scalars().all())
 
 
-async def get_users(skip: int, limit: int, db: Session) -> list[User]:
+async def stream_users(db: AsyncSession, batch_size: int = 1000):
     """
-    The get_users function returns a list of all users from the database.
+    The stream_users function yields batches of (id, email, role) rows of all users.
+    Rows are fetched through a server-side cursor, so memory use does not grow with the table.
 
-    :param skip: int: Skip the first n records in the database
-    :param limit: int: Limit the number of results returned
-    :param db: Session: Pass the database session to the function
-    :return: A list of all users
+    :param db: AsyncSession: Pass the database session to the function
+    :param batch_size: int: The number of rows fetched per round-trip
+    :return: An async iterator of row batches
     """
-    query = db.query(User).offset(skip).limit(limit).all()
-    return query
+    result = await db.stream(
+        select(User.id, User.email, User.role)
+        .order_by(User.id)
+        .execution_options(yield_per=batch_size)
+    )
+    async for partition in result.partitions():
+        yield partition
 
 
-async def make_user_role(email: str, role: Role, db: Session) -> None:
+async def make_user_role(email: str, role: Role, db: AsyncSession) -> None:
     """
     The make_user_role function takes in an email and a role, and then updates the user's role to that new one.
     Args:
@@ -99,81 +253,54 @@ async def make_user_role(email: str, role: Role, db: Session) -> None:
 
     :param email: str: Get the user by email
     :param role: Role: Set the role of the user
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: None
     """
 
-    user = await get_user_by_email(email, db)
+    user = await get_user_by_email(email, db, primary=True)
     user.role = role
     try:
-        db.commit()
+        await db.commit()
+        await recent_writes.mark(user.id, user.email)
+        await principal_cache.invalidate_everywhere(user.id)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise e
 
 
-async def write_verification_code(
-    email: str, db: Session, verification_code: int
-) -> None:
+async def rehash_user_password(
+    user_id: uuid.UUID, old_hash: str, new_hash: str, db: AsyncSession
+) -> bool:
     """
-    :param email: str: Pass the email address of the user to be confirmed
-    :param db: Session: Pass the database session into the function
-    :return: None
+    The rehash_user_password function replaces a password hash with one made under the current hashing policy.
+    The update only applies if the stored hash is still old_hash, so a concurrent password change wins.
+
+    :param user_id: uuid.UUID: The id of the user
+    :param old_hash: str: The hash the password was verified against
+    :param new_hash: str: The replacement hash
+    :param db: AsyncSession: Pass the database session to the function
+    :return: True if the hash was replaced
     """
-    verification_record = (
-        db.query(Verification).filter(Verification.email == email).first()
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, User.password == old_hash)
+        .values(password=new_hash)
     )
-    if verification_record:
-        verification_record.verification_code = verification_code
-        try:
-            db.commit()
-            logger.debug("Updated verification code in the existing record")
-        except Exception as e:
-            db.rollback()
-            raise e
-    else:
-        verification_record = Verification(
-            email=email, verification_code=verification_code
-        )
-        try:
-            db.add(verification_record)
-            db.commit()
-            db.refresh(verification_record)
-            logger.debug("Created new verification record")
-        except Exception as e:
-            db.rollback()
-            raise e
-
-
-async def verify_verification_code(
-    email: str, db: Session, verification_code: int
-) -> None:
-    """
-    :param email: str: Pass the email address of the user to be confirmed
-    :param db: Session: Pass the database session into the function
-    :return: None
-    """
-    try:
-        verification_record = (
-            db.query(Verification).filter(Verification.email == email).first()
-        )
-        if verification_record.verification_code == verification_code:
-            verification_record.email_confirmation = True
-            return True
-        else:
-            None
-    except Exception as e:
-        raise e
+    await db.commit()
+    await recent_writes.mark(user_id)
+    return result.rowcount == 1
 
 
-async def change_user_password(email: str, password: str, db: Session) -> None:
+async def change_user_password(email: str, password: str, db: AsyncSession) -> None:
 
-    user = await get_user_by_email(email, db)
-    password = auth_service.get_password_hash(password)
+    user = await get_user_by_email(email, db, primary=True)
+    password = await auth_service.get_password_hash(password)
     user.password = password
     try:
-        db.commit()
+        await db.commit()
+        await recent_writes.mark(user.id, user.email)
+        await principal_cache.invalidate_everywhere(user.id)
         logger.debug("Password has changed")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise e
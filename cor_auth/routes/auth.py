@@ -4,17 +4,19 @@ from fastapi import (
     Depends,
     status,
     Security,
-    BackgroundTasks,
     Request,
     Query,
+    Form,
 )
 from fastapi.security import (
     OAuth2PasswordRequestForm,
     HTTPAuthorizationCredentials,
     HTTPBearer,
 )
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from random import randint
+import hmac
+import math
 
 from cor_auth.database.db import get_db
 from cor_auth.schemas import (
@@ -25,14 +27,20 @@ from cor_auth.schemas import (
     VerificationModel,
     ChangePasswordModel,
     LoginResponseModel,
+    IntrospectionRequest,
+    IntrospectionResponse,
 )
 from cor_auth.repository import users as repository_users
+from cor_auth.repository import tokens as repository_tokens
 from cor_auth.services.auth import auth_service
 from cor_auth.services.email import send_email_code, send_email_code_forgot_password
+from cor_auth.services.verification import verification_store
+from cor_auth.services.rate_limit import login_throttle
 from cor_auth.conf.config import settings
 from cor_auth.services.logger import logger
+from cor_auth.services.metrics import MetricsRoute
 
-router = APIRouter(prefix="/auth", tags=["Authorization"])
+router = APIRouter(prefix="/auth", tags=["Authorization"], route_class=MetricsRoute)
 security = HTTPBearer()
 SECRET_KEY = settings.secret_key
 ALGORITHM = settings.algorithm
@@ -42,26 +50,26 @@ ALGORITHM = settings.algorithm
 )
 async def signup(
     body: UserModel,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The signup function creates a new user in the database.
-        It takes an email and password as input, hashes the password, and stores it in the database.
+        It takes an email and password as input, hashes the password, and stores it in the database
+        with a single INSERT ... ON CONFLICT DO NOTHING.
         If there is already a user with that email address, it returns an error message.
 
     :param body: UserModel: Get the data from the request body
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A dict, but the function expects a usermodel
     """
-    exist_user = await repository_users.get_user_by_email(body.email, db)
-    if exist_user:
-        logger.debug(f"{body.email} user already exist")
+    body.password = await auth_service.get_password_hash(body.password)
+    new_user = await repository_users.create_user(body, db)
+    if new_user is None:
+        logger.debug("%s user already exist", body.email)
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT, detail="Account already exists"
         )
-    body.password = auth_service.get_password_hash(body.password)
-    new_user = await repository_users.create_user(body, db)
-    logger.debug(f"{body.email} user successfully created")
+    logger.debug("%s user successfully created", body.email)
     return {"user": new_user, "detail": "User successfully created"}
 
 
@@ -72,42 +80,73 @@ async def signup(
 async def login(
     request: Request,
     body: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db),
+    redirectUrl: str | None = Form(None),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The login function is used to authenticate a user.
+    Attempts are throttled per email and per client IP before the user lookup and the password check.
+    A password hash made with an outdated scheme or cost is replaced on a successful login.
 
     :param body: OAuth2PasswordRequestForm: Get the username and password from the request body
-    :param db: Session: Get the database session
+    :param redirectUrl: str | None: Where the client will send the tokens; must be an allowed origin
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with the access_token, refresh_token and token type
     """
+    if redirectUrl is not None and not auth_service.is_valid_redirect_url(redirectUrl):
+        raise HTTPException(status_code=400, detail="Invalid redirect URL")
+    retry_after = await login_throttle.check(
+        body.username, request.client.host if request.client else None
+    )
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found / invalid email",
         )
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update_password(
+        body.password, user.password
+    )
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password"
         )
-    if user.email in settings.eternal_accounts:
+    if new_hash is not None:
+        # Хэш сделан по устаревшей схеме или стоимости — пересчитываем, пока пароль известен
+        await repository_users.rehash_user_password(user.id, user.password, new_hash, db)
+    eternal = user.email in settings.eternal_accounts
+    if eternal:
         access_token = await auth_service.create_access_token(
-            data={"oid": user.id}, expires_delta=1000000
+            data={"oid": str(user.id)}, expires_delta=1000000
         )
-        refresh_token = await auth_service.create_refresh_token(data={"oid": user.id}, expires_delta=10000000)
     else:
         access_token = await auth_service.create_access_token(
-            data={"oid": user.id}, expires_delta=1
+            data={"oid": str(user.id)}, expires_delta=1
         )
-        refresh_token = await auth_service.create_refresh_token(data={"oid": user.id})
-    await repository_users.update_token(user, refresh_token, db)
-    logger.debug(f"{user.email}  login success")
-    return {
+    refresh_token = await auth_service.create_refresh_token()
+    family_id, token_hash = await auth_service.decode_refresh_token(refresh_token)
+    await repository_tokens.create_refresh_token(
+        user.id,
+        family_id,
+        token_hash,
+        auth_service.refresh_token_expires_at(eternal),
+        db,
+    )
+    logger.debug("%s login success", user.email)
+    response = {
         "access_token": access_token,
         "refresh_token": refresh_token,
         "token_type": "bearer",
     }
+    if redirectUrl is not None:
+        response["redirectUrl"] = redirectUrl
+    return response
 
 
 @router.get(
@@ -116,35 +155,46 @@ async def login(
 )
 async def refresh_token(
     credentials: HTTPAuthorizationCredentials = Security(security),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     The refresh_token function is used to refresh the access token.
     It takes in a refresh token and returns an access_token, a new refresh_token, and the type of token (bearer).
+    The rotation is a single conditional update; presenting a token that is no longer current revokes its whole family.
+    The only exception is the token replaced in the last REFRESH_TOKEN_GRACE_PERIOD seconds: two tabs refreshing
+    with the same token at once both get the same new token.
 
 
     :param credentials: HTTPAuthorizationCredentials: Get the credentials from the request header
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :return: A new access token and a new refresh token
     """
     token = credentials.credentials
-    id = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_uuid(id, db)
-    if user.refresh_token != token:
-        await repository_users.update_token(user, None, db)
+    family_id, old_hash = await auth_service.decode_refresh_token(token)
+    refresh_token = auth_service.successor_refresh_token(token)
+    _, new_hash = await auth_service.decode_refresh_token(refresh_token)
+    rotated = await repository_tokens.rotate_refresh_token(
+        old_hash,
+        new_hash,
+        auth_service.refresh_token_expires_at(),
+        auth_service.refresh_token_expires_at(eternal=True),
+        db,
+    )
+    if rotated is None and settings.refresh_token_grace_period > 0:
+        rotated = await repository_tokens.get_rotated(
+            family_id, new_hash, settings.refresh_token_grace_period, db
+        )
+    if rotated is None:
+        await repository_tokens.revoke_family(family_id, db)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token"
         )
-    if user.email in settings.eternal_accounts:
-        access_token = await auth_service.create_access_token(data={"oid": user.id}, expires_delta=1000000)
-        refresh_token = await auth_service.create_refresh_token(data={"oid": user.id}, expires_delta=10000000)
+    user_id, email = rotated
+    if email in settings.eternal_accounts:
+        access_token = await auth_service.create_access_token(data={"oid": str(user_id)}, expires_delta=1000000)
     else:
-        access_token = await auth_service.create_access_token(data={"oid": user.id})
-        refresh_token = await auth_service.create_refresh_token(data={"oid": user.id})
-    user.refresh_token = refresh_token
-    db.commit()
-    await repository_users.update_token(user, refresh_token, db)
-    logger.debug(f"{user.email}'s refresh token updated")
+        access_token = await auth_service.create_access_token(data={"oid": str(user_id)})
+    logger.debug("%s's refresh token updated", email)
     return {
         "access_token": access_token,
         "refresh_token": refresh_token,
@@ -152,55 +202,91 @@ async def refresh_token(
     }
 
 
+@router.post("/introspect", response_model=IntrospectionResponse)
+async def introspect(
+    body: IntrospectionRequest,
+    credentials: HTTPAuthorizationCredentials = Security(security),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    The introspect function validates a batch of access tokens for an API gateway.
+    Gateways authenticate with the INTROSPECTION_SECRET bearer token. All tokens are decoded locally and
+    the users they reference are resolved with at most one database query.
+
+    :param body: IntrospectionRequest: The tokens to validate
+    :param credentials: HTTPAuthorizationCredentials: The gateway's bearer secret
+    :param db: AsyncSession: Pass the database session to the function
+    :return: One result per token, in request order, with active, sub, role and exp
+    """
+    if not settings.introspection_secret or not hmac.compare_digest(
+        credentials.credentials.encode(), settings.introspection_secret.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+        )
+    payloads = [auth_service.decode_access_token(token) for token in body.tokens]
+    ids = {payload["oid"] for payload in payloads if payload and payload.get("oid")}
+    principals = await auth_service.get_principals(ids, db)
+    results = []
+    for payload in payloads:
+        principal = principals.get(payload.get("oid")) if payload else None
+        if principal is None:
+            results.append({"active": False})
+        else:
+            results.append(
+                {
+                    "active": True,
+                    "sub": principal.id,
+                    "role": principal.role,
+                    "exp": payload.get("exp"),
+                }
+            )
+    return {"results": results}
+
+
 @router.post(
     "/send_verification_code"
 )  # Маршрут проверки почты в случае если это новая регистрация
 async def send_verification_code(
     body: EmailSchema,
-    background_tasks: BackgroundTasks,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     verification_code = randint(100000, 999999)
 
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
 
-        logger.debug(f"{body.email}Account already exists")
+        logger.debug("%s Account already exists", body.email)
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="Account already exists",
         )
 
     if exist_user == None:
-        background_tasks.add_task(
-            send_email_code, body.email, request.base_url, verification_code
-        )
+        await verification_store.issue(body.email, verification_code)
+        await send_email_code(body.email, request.base_url, verification_code)
         logger.debug("Check your email for verification code.")
-        await repository_users.write_verification_code(
-            email=body.email, db=db, verification_code=verification_code
-        )
 
     return {"message": "Check your email for verification code."}
 
 
 # Маршрут подтверждения почты/кода
 @router.post("/confirm_email")
-async def confirm_email(body: VerificationModel, db: Session = Depends(get_db)):
+async def confirm_email(body: VerificationModel):
 
-    ver_code = await repository_users.verify_verification_code(
-        body.email, db, body.verification_code
-    )
+    ver_code = await verification_store.verify(body.email, body.verification_code)
     confirmation = False
     if ver_code:
         confirmation = True
-        logger.debug(f"Your {body.email} is confirmed")
+        logger.debug("Your %s is confirmed", body.email)
         return {
             "message": "Your email is confirmed",  # Сообщение для JS о том что имейл подтвержден
             "confirmation": confirmation,
         }
     else:
-        logger.debug(f"{body.email} - Invalid verification code")
+        logger.debug("%s - Invalid verification code", body.email)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid verification code"
         )
@@ -209,9 +295,8 @@ async def confirm_email(body: VerificationModel, db: Session = Depends(get_db)):
 @router.post("/forgot_password")  # Маршрут проверки почты в случае если забыли пароль
 async def forgot_password_send_verification_code(
     body: EmailSchema,
-    background_tasks: BackgroundTasks,
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
 
     verification_code = randint(100000, 999999)
@@ -221,21 +306,16 @@ async def forgot_password_send_verification_code(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
     if exist_user:
-        background_tasks.add_task(
-            send_email_code_forgot_password,
-            body.email,
-            request.base_url,
-            verification_code,
-        )
-        await repository_users.write_verification_code(
-            email=body.email, db=db, verification_code=verification_code
+        await verification_store.issue(body.email, verification_code)
+        await send_email_code_forgot_password(
+            body.email, request.base_url, verification_code
         )
-        logger.debug(f"{body.email} - Check your email for verification code.")
+        logger.debug("%s - Check your email for verification code.", body.email)
     return {"message": "Check your email for verification code."}
 
 
 @router.patch("/change_password")
-async def change_password(body: ChangePasswordModel, db: Session = Depends(get_db)):
+async def change_password(body: ChangePasswordModel, db: AsyncSession = Depends(get_db)):
     user = await repository_users.get_user_by_email(body.email, db)
     if not user:
         raise HTTPException(
@@ -244,7 +324,7 @@ async def change_password(body: ChangePasswordModel, db: Session = Depends(get_d
     else:
         if body.password:
             await repository_users.change_user_password(body.email, body.password, db)
-            logger.debug(f"{body.email} - changed his password")
+            logger.debug("%s - changed his password", body.email)
             return {"message": f"User '{body.email}' changed his password"}
         else:
             print("Incorrect password input")
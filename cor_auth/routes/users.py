@@ -1,44 +1,123 @@
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+import base64
+import binascii
+import io
+import json
+import uuid
 
-from cor_auth.database.db import get_db
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_auth.database.db import get_db, AsyncSessionLocal
 from cor_auth.services.auth import auth_service
 from cor_auth.database.models import User, Role
 from cor_auth.schemas import UserDb
 from cor_auth.services.roles import free_access, admin
 from cor_auth.repository import users
+from cor_auth.services.metrics import MetricsRoute
+from cor_auth.services.provisioning import FORMATS, import_users, read_rows
 from pydantic import EmailStr
 
-router = APIRouter(prefix="/users", tags=["Users"])
+router = APIRouter(prefix="/users", tags=["Users"], route_class=MetricsRoute)
+
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(user_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(user_id.bytes).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> uuid.UUID:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return uuid.UUID(bytes=base64.b64decode(padded, altchars=b"-_", validate=True))
+    except (binascii.Error, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
 
 
 @router.get(
     "/get_all", response_model=list[UserDb], dependencies=[Depends(free_access)]
 )
 async def get_all_users(
-    skip: int = 0,
-    limit: int = 10,
+    response: Response,
+    cursor: str | None = None,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
     user: User = Depends(auth_service.get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
     **Get a list of users.**
     This route allows to get a list of pagination-aware users.
+    The X-Next-Cursor response header holds the cursor of the next page and is absent on the last page.
     Level of Access:
     - Current authorized user
-    :param skip: int: Number of users to skip.
-    :param limit: int: Maximum number of users to return.
+    :param cursor: str: Opaque continuation token from the previous page.
+    :param limit: int: Maximum number of users to return, from 1 to 100.
     :param current_user: User: Current authenticated user.
-    :param db: Session: Database session.
+    :param db: AsyncSession: Database session.
     :return: List of users.
     :rtype: List[UserDb]
     """
-    list_users = await users.get_users(skip, limit, db)
+    after = decode_cursor(cursor) if cursor else None
+    list_users = await users.get_users(after, limit, db)
+    if len(list_users) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(list_users[-1].id)
     return list_users
 
 
+@router.get("/export", dependencies=[Depends(admin)])
+async def export_users():
+    """
+    **Export all users as NDJSON.**
+    This route streams every user as one JSON object per line, reading through a server-side cursor.
+    Level of Access:
+    - Administrator
+    :return: A streaming application/x-ndjson response.
+    """
+
+    async def lines():
+        # Сессия открывается внутри генератора, чтобы жить всё время передачи
+        async with AsyncSessionLocal() as db:
+            async for batch in users.stream_users(db):
+                yield "".join(
+                    json.dumps({"id": str(id), "email": email, "role": role.value}) + "\n"
+                    for id, email, role in batch
+                )
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@router.post("/import", dependencies=[Depends(admin)])
+async def import_users_file(
+    file: UploadFile,
+    format: str | None = None,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    **Create users in bulk from a CSV or NDJSON file.**
+    Each row has an email, a plain-text password or a bcrypt password_hash, and an optional role.
+    Existing emails are reported as conflicts and left untouched.
+    Level of Access:
+    - Administrator
+    :param file: UploadFile: The file with users.
+    :param format: str: csv or ndjson. Guessed from the file name if omitted.
+    :param db: AsyncSession: Database Session.
+    :return: The number of created users, conflicting emails and invalid rows.
+    :rtype: dict
+    """
+    format = format or (file.filename or "").rsplit(".", 1)[-1].lower()
+    if format not in FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format"
+        )
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", newline="")
+    return await import_users(read_rows(stream, format), db)
+
+
 @router.patch("/asign_role/{role}", dependencies=[Depends(admin)])
-async def assign_role(email: EmailStr, role: Role, db: Session = Depends(get_db)):
+async def assign_role(email: EmailStr, role: Role, db: AsyncSession = Depends(get_db)):
     """
     **Assign a role to a user by email.**
     This route allows to assign the selected role to a user by their email.
@@ -46,7 +125,7 @@ async def assign_role(email: EmailStr, role: Role, db: Session = Depends(get_db)
     - Administrator
     :param email: EmailStr: Email of the user to whom you want to assign the role.
     :param role: Role: The selected role for the assignment (Administrator, Moderator or User).
-    :param db: Session: Database Session.
+    :param db: AsyncSession: Database Session.
     :return: Message about successful role change.
     :rtype: dict
     """
@@ -1,3 +1,5 @@
+import uuid
+
 from pydantic import BaseModel, Field, EmailStr
 from cor_auth.database.models import Role
 
@@ -8,7 +10,7 @@ class UserModel(BaseModel):
 
 
 class UserDb(BaseModel):
-    id: str
+    id: uuid.UUID
     email: str
     role: Role
 
@@ -34,6 +36,21 @@ class LoginResponseModel(BaseModel):
     redirectUrl: str = "https://cor-identity-01s.cor-medical.ua"
 
 
+class IntrospectionRequest(BaseModel):
+    tokens: list[str] = Field(min_length=1, max_length=100)
+
+
+class IntrospectionResult(BaseModel):
+    active: bool
+    sub: str | None = None
+    role: Role | None = None
+    exp: int | None = None
+
+
+class IntrospectionResponse(BaseModel):
+    results: list[IntrospectionResult]
+
+
 class EmailSchema(BaseModel):
     email: EmailStr
 
@@ -1,26 +1,35 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+import uuid
 from typing import Optional
 
-from jose import JWTError, jwt
+from jose import JWTError
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import timedelta, datetime, timezone
-from sqlalchemy.orm import Session
-from urllib.parse import urlparse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from cor_auth.database.db import get_db
 from cor_auth.repository import users as repository_users
-from cor_auth.conf.config import settings
 from cor_auth.services.logger import logger
+from cor_auth.services.hashing import password_hasher
+from cor_auth.services.principal_cache import Principal, principal_cache
+from cor_auth.services import metrics, timing
+from cor_auth.services.keys import key_ring
+from cor_auth.services.jwt_codec import jwt_codec
+from cor_auth.services.origins import origin_policy
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-    SECRET_KEY = settings.secret_key
-    ALGORITHM = settings.algorithm
+    password_hasher = password_hasher
+    key_ring = key_ring
+    jwt_codec = jwt_codec
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and the hashed version of that password,
             and returns True if they match, False otherwise. This is used to verify that the user's login
@@ -31,17 +40,29 @@ class Auth:
         :param hashed_password: Compare the plain_password parameter to see if they match
         :return: True if the password is correct, and false otherwise
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await self.password_hasher.verify(plain_password, hashed_password)
 
-    def get_password_hash(self, password: str):
+    async def verify_and_update_password(self, plain_password: str, hashed_password: str):
+        """
+        The verify_and_update_password function checks a password like verify_password and also returns
+        a replacement hash when the stored one was made with an outdated scheme or cost.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: The password entered by the user
+        :param hashed_password: str: The stored hash
+        :return: A tuple of whether the password is correct and the new hash to store (or None)
+        """
+        return await self.password_hasher.verify_and_update(plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-            The function uses the pwd_context object to generate a hash from the given password.
+            The hash is computed in the password_hasher process pool, so the event loop is not blocked.
         :param self: Represent the instance of the class
         :param password: str: Pass the password into the function
         :return: A hash of the password
         """
-        return self.pwd_context.hash(password)
+        return await self.password_hasher.hash(password)
 
     async def create_access_token(
         self, data: dict, expires_delta: Optional[float] = None
@@ -53,125 +74,157 @@ class Auth:
         :param expires_delta: Optional[float]: Set the time limit for the token
         :return: A string
         """
+        now = int(time.time())
         to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.now(timezone.utc) + timedelta(hours=expires_delta)
-        else:
-            expire = datetime.now(timezone.utc) + timedelta(hours=1)
         to_encode.update(
-            {"iat": datetime.now(timezone.utc), "exp": expire, "scp": "access_token"}
-        )
-
-        encoded_access_token = jwt.encode(
-            to_encode, key=self.SECRET_KEY, algorithm=self.ALGORITHM
+            {
+                "iat": now,
+                "exp": now + int((expires_delta or 1) * 3600),
+                "scp": "access_token",
+            }
         )
-        logger.debug(f"Access token: {encoded_access_token}")
+        with timing.phase("jwt"), metrics.JWT_ENCODE.time():
+            encoded_access_token = self.jwt_codec.encode(to_encode)
+        logger.debug("Access token: %s", encoded_access_token)
         return encoded_access_token
 
-    async def create_refresh_token(
-        self, data: dict, expires_delta: Optional[float] = None
-    ):
+    def refresh_token_expires_at(self, eternal: bool = False) -> datetime:
         """
-        The create_refresh_token function creates a refresh token for the user.
-            Args:
-                data (dict): A dictionary containing the user's id and username.
-                expires_delta (Optional[float]): The number of seconds until the refresh token expires. Defaults to None, which sets it to 7 days from now.
+        The refresh_token_expires_at function returns when a refresh token issued now expires.
 
         :param self: Represent the instance of the class
-        :param data: dict: Pass in the user data that we want to encode
-        :param expires_delta: Optional[float]: Set the expiration time of the refresh token
-        :return: A refresh token that is encoded with the user's id, username, email and scope
+        :param eternal: bool: Whether the token belongs to one of settings.eternal_accounts
+        :return: The expiry as an aware datetime
         """
-        to_encode = data.copy()
-        if expires_delta:
-            expire = datetime.now(timezone.utc) + timedelta(hours=expires_delta)
-        else:
-            expire = datetime.now(timezone.utc) + timedelta(days=7)
-        to_encode.update(
-            {"iat": datetime.now(timezone.utc), "exp": expire, "scp": "refresh_token"}
-        )
+        if eternal:
+            return datetime.now(timezone.utc) + timedelta(hours=10000000)
+        return datetime.now(timezone.utc) + timedelta(days=7)
 
-        encoded_refresh_token = jwt.encode(
-            to_encode, key=self.SECRET_KEY, algorithm=self.ALGORITHM
-        )
-        logger.debug(f"refresh token: {encoded_refresh_token}")
-        return encoded_refresh_token
+    async def create_refresh_token(self, family_id: Optional[str] = None):
+        """
+        The create_refresh_token function creates an opaque refresh token of the form <family_id>.<secret>.
+            Only the sha256 of the token is stored, so the token itself carries no claims and needs no parsing.
 
-    async def decode_refresh_token(self, refresh_token: str):
+        :param self: Represent the instance of the class
+        :param family_id: Optional[str]: The family of a rotated token. A new family is started if None
+        :return: A refresh token string
         """
-        The decode_refresh_token function takes a refresh token and decodes it.
-            If the scope is 'refresh_token', then we return the email address of the user.
-            Otherwise, we raise an HTTPException with status code 401 (UNAUTHORIZED) and detail message 'Invalid scope for token'.
+        family_id = family_id or uuid.uuid4().hex
+        return f"{family_id}.{secrets.token_urlsafe(32)}"
 
+    def successor_refresh_token(self, refresh_token: str) -> str:
+        """
+        The successor_refresh_token function derives the token that replaces refresh_token on rotation.
+            The secret is an HMAC of the presented token, so concurrent refreshes with the same token
+            (e.g. two browser tabs) get the same successor and the loser of the race can be given it too.
 
         :param self: Represent the instance of the class
-        :param refresh_token: str: Pass in the refresh token that was sent by the user
-        :return: The email of the user who requested it
+        :param refresh_token: str: The refresh token presented by the client
+        :return: A refresh token string of the same family
         """
-        try:
+        family_id, _, _ = refresh_token.partition(".")
+        digest = hmac.new(
+            self.key_ring.secret.encode(), refresh_token.encode(), hashlib.sha256
+        ).digest()
+        return f"{family_id}.{base64.urlsafe_b64encode(digest).rstrip(b'=').decode()}"
 
-            payload = jwt.decode(
-                refresh_token, key=self.SECRET_KEY, algorithms=self.ALGORITHM
-            )
+    async def decode_refresh_token(self, refresh_token: str):
+        """
+        The decode_refresh_token function splits an opaque refresh token into its family id and hash.
+            If the token is malformed, we raise an HTTPException with status code 401 (UNAUTHORIZED).
 
-            if payload["scp"] == "refresh_token":
-                id = payload["oid"]
-                return id
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid scope for token",
-            )
-        except JWTError:
+        :param self: Represent the instance of the class
+        :param refresh_token: str: Pass in the refresh token that was sent by the user
+        :return: A tuple of the family id and the sha256 of the token
+        """
+        family_id, _, secret = refresh_token.partition(".")
+        if len(family_id) != 32 or not secret:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
             )
+        token_hash = hashlib.sha256(refresh_token.encode()).hexdigest()
+        return family_id, token_hash
+
+    def decode_access_token(self, token: str) -> dict | None:
+        """
+        The decode_access_token function verifies an access token and returns its claims.
+
+        :param self: Represent the instance of the class
+        :param token: str: An encoded access token
+        :return: The claims, or None if the token is invalid, expired or not an access token
+        """
+        try:
+            with timing.phase("jwt"), metrics.JWT_DECODE.time():
+                payload = self.jwt_codec.decode(token)
+        except JWTError:
+            return None
+        if payload.get("scp") != "access_token":
+            return None
+        return payload
+
+    async def get_principals(self, ids: set[str], db: AsyncSession) -> dict[str, Principal]:
+        """
+        The get_principals function resolves many user ids at once.
+        Ids missing from principal_cache are loaded with a single WHERE id IN (...) query.
+
+        :param self: Represent the instance of the class
+        :param ids: set[str]: The user ids to resolve
+        :param db: AsyncSession: Get the database session
+        :return: A dict of id to Principal for the users that exist
+        """
+        principals = {}
+        missing = []
+        for id in ids:
+            principal = principal_cache.get(id)
+            if principal is None:
+                missing.append(id)
+            else:
+                principals[id] = principal
+        if missing:
+            for user in await repository_users.get_users_by_uuids(missing, db):
+                principal = Principal.from_user(user)
+                principal_cache.put(principal)
+                principals[principal.id] = principal
+        return principals
 
     async def get_current_user(
-        self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
+        self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
     ):
         """
         The get_current_user function is a dependency that will be used in the protected routes.
-        It takes an access token as input and returns the user object if it's valid, otherwise raises an exception.
+        It takes an access token as input and returns the principal if it's valid, otherwise raises an exception.
+        Principals are served from principal_cache, so only a cache miss costs a database round-trip.
 
         :param self: Represent the instance of the class
         :param token: str: Get the token from the request header
-        :param db: Session: Get the database session
-        :return: An object of type user
+        :param db: AsyncSession: Get the database session
+        :return: A Principal with the user's id, email and role
         """
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
-        try:
-
-            payload = jwt.decode(token, key=self.SECRET_KEY, algorithms=self.ALGORITHM)
-
-            if payload["scp"] == "access_token":
-                id = payload["oid"]
-                if id is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-        except JWTError as e:
+        payload = self.decode_access_token(token)
+        if payload is None or payload.get("oid") is None:
             raise credentials_exception
+        id = payload["oid"]
 
+        principal = principal_cache.get(id)
+        if principal is not None:
+            return principal
         user = await repository_users.get_user_by_uuid(id, db)
         if user is None:
             raise credentials_exception
-        return user
+        principal = Principal.from_user(user)
+        principal_cache.put(principal)
+        return principal
     
 
     # Функция для проверки допустимости редирект URL
     def is_valid_redirect_url(self, redirectUrl):
-        allowed_urls = settings.allowed_redirect_urls
-        parsed_url = urlparse(redirectUrl)
-        if parsed_url.scheme not in ["http", "https"]:
-            return False
-        if f"{parsed_url.scheme}://{parsed_url.netloc}" not in allowed_urls:
-            return False
-        return True
+        return origin_policy.allows_url(redirectUrl)
 
 
 auth_service = Auth()
@@ -1,28 +1,202 @@
+import asyncio
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+import aiosmtplib
+from fastapi import HTTPException, status
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 from pydantic import EmailStr
 
 from cor_auth.conf.config import settings
 from cor_auth.services.logger import logger
+from cor_auth.services import metrics
 
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="COR-Identity",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent.parent / "templates",
+TEMPLATE_FOLDER = Path(__file__).parent.parent / "templates"
+
+# Шаблоны компилируются один раз и кэшируются окружением Jinja
+templates = Environment(
+    loader=FileSystemLoader(TEMPLATE_FOLDER),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+)
+
+
+class MailJob:
+    __slots__ = ("recipient", "subject", "template_name", "context", "attempts")
+
+    def __init__(self, recipient: str, subject: str, template_name: str, context: dict):
+        self.recipient = recipient
+        self.subject = subject
+        self.template_name = template_name
+        self.context = context
+        self.attempts = 0
+
+
+class MailDeliveryWorker:
+    """
+    A long-lived delivery worker. Messages are put on a bounded queue and sent by
+    pool_size consumers, each holding its own authenticated SMTP connection.
+    A consumer drains up to batch_size messages per wake-up and retries failed
+    sends with exponential backoff.
+    """
+
+    def __init__(
+        self,
+        pool_size: int,
+        queue_size: int,
+        batch_size: int,
+        max_retries: int,
+        retry_backoff: float,
+    ):
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.sent = 0
+        self.failed = 0
+
+    async def start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [
+            asyncio.create_task(self._consume(), name=f"mail-worker-{i}")
+            for i in range(self.pool_size)
+        ]
+        logger.info("Mail delivery worker started with %d connections", self.pool_size)
+
+    async def stop(self, timeout: float = 10):
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.error("Mail queue not drained on shutdown, %d messages lost", self.queue.qsize())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(
+        self, recipient: str, subject: str, template_name: str, context: dict
+    ) -> None:
+        """
+        The enqueue function puts a message on the delivery queue without waiting.
+        If the queue is full (e.g. while SMTP is down) the request fails fast with 503
+        instead of hanging until the worker catches up.
+
+        :param self: Represent the instance of the class
+        :param recipient: str: The address to send the message to
+        :param subject: str: The subject of the message
+        :param template_name: str: The template in cor_auth/templates to render
+        :param context: dict: Variables passed to the template
+        :return: None
+        """
+        if not self._tasks:
+            await self.start()
+        try:
+            self.queue.put_nowait(MailJob(recipient, subject, template_name, context))
+        except asyncio.QueueFull:
+            self.failed += 1
+            logger.warning("Mail queue is full, rejecting email to %s", recipient)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Email delivery is temporarily unavailable",
+                headers={"Retry-After": "30"},
+            )
+
+    def qsize(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.mail_server,
+            port=settings.mail_port or None,
+            use_tls=settings.mail_ssl_tls,
+            start_tls=settings.mail_starttls,
+            validate_certs=settings.mail_validate_certs,
+        )
+        await smtp.connect()
+        if settings.mail_use_credentials:
+            await smtp.login(settings.mail_username, settings.mail_password)
+        return smtp
+
+    def _build_message(self, job: MailJob) -> EmailMessage:
+        html = templates.get_template(job.template_name).render(**job.context)
+        message = EmailMessage()
+        message["From"] = formataddr(("COR-Identity", settings.mail_from))
+        message["To"] = job.recipient
+        message["Subject"] = job.subject
+        message.set_content(html, subtype="html")
+        return message
+
+    def _retry(self, job: MailJob, error: Exception):
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            self.failed += 1
+            logger.error("Giving up sending email to %s: %s", job.recipient, error)
+            return
+        delay = self.retry_backoff * 2 ** (job.attempts - 1)
+        logger.debug("Retrying email to %s in %.1fs: %s", job.recipient, delay, error)
+        asyncio.get_running_loop().call_later(delay, self._requeue, job)
+
+    def _requeue(self, job: MailJob):
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.failed += 1
+            logger.error("Mail queue is full, dropping retry to %s", job.recipient)
+
+    async def _consume(self):
+        smtp: aiosmtplib.SMTP | None = None
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < self.batch_size and not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                for job in batch:
+                    try:
+                        if smtp is None or not smtp.is_connected:
+                            smtp = await self._connect()
+                        await smtp.send_message(self._build_message(job))
+                        self.sent += 1
+                        logger.debug("Sending email to %s done!", job.recipient)
+                    except (aiosmtplib.SMTPException, OSError) as err:
+                        smtp = None
+                        self._retry(job, err)
+                    except Exception as err:
+                        # Ошибка в самом письме (например, в шаблоне) не должна остановить воркер
+                        self.failed += 1
+                        logger.error("Failed to send email to %s", job.recipient, exc_info=err)
+                    finally:
+                        self.queue.task_done()
+        finally:
+            if smtp is not None and smtp.is_connected:
+                try:
+                    await smtp.quit()
+                except (aiosmtplib.SMTPException, OSError):
+                    smtp.close()
+
+
+mail_worker = MailDeliveryWorker(
+    pool_size=settings.mail_pool_size,
+    queue_size=settings.mail_queue_size,
+    batch_size=settings.mail_batch_size,
+    max_retries=settings.mail_max_retries,
+    retry_backoff=settings.mail_retry_backoff,
 )
 
 
+@metrics.sampler
+def _sample_queue():
+    metrics.EMAIL_QUEUE_DEPTH.set(mail_worker.qsize())
+
+
 async def send_email_code(
     email: EmailStr, host: str, verification_code
 ):  # registration
@@ -36,23 +210,13 @@ async def send_email_code(
     :param host: str: Pass the hostname of the server to the template
     :return: A coroutine object
     """
-    logger.debug(f"Sending email to {email}")
-    try:
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={
-                "host": host,
-                "code": verification_code,
-            },
-            subtype=MessageType.html,
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_templates.html")
-        logger.debug(f"Sending email to {email} done!")
-    except ConnectionErrors as err:
-        print(err)
+    logger.debug("Queueing email to %s", email)
+    await mail_worker.enqueue(
+        email,
+        "Confirm your email ",
+        "email_templates.html",
+        {"host": host, "code": verification_code},
+    )
 
 
 async def send_email_code_forgot_password(
@@ -68,22 +232,10 @@ async def send_email_code_forgot_password(
     :param host: str: Pass the hostname of the server to the template
     :return: A coroutine object
     """
-    logger.debug(f"Sending email to {email}")
-    try:
-        message = MessageSchema(
-            subject="Forgot Password",
-            recipients=[email],
-            template_body={
-                "host": host,
-                "code": verification_code,
-            },
-            subtype=MessageType.html,
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(
-            message, template_name="forgot_password_email_template.html"
-        )
-        logger.debug(f"Sending email to {email} done!")
-    except ConnectionErrors as err:
-        print(err)
+    logger.debug("Queueing email to %s", email)
+    await mail_worker.enqueue(
+        email,
+        "Forgot Password",
+        "forgot_password_email_template.html",
+        {"host": host, "code": verification_code},
+    )
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+from cor_auth.conf.config import settings
+from cor_auth.services.logger import logger
+from cor_auth.services import metrics, timing
+
+
+# Минимумы OWASP: ниже них калибровка не опускается, даже если бюджет задержки меньше
+BCRYPT_MIN_ROUNDS = 10
+ARGON2_MIN_MEMORY_COST = 19456
+# Верхние пределы: 31 — максимум bcrypt в passlib, для argon2 больше проходов не имеет смысла
+BCRYPT_MAX_ROUNDS = 31
+ARGON2_MAX_TIME_COST = 20
+
+
+def create_crypt_context(
+    schemes: list[str],
+    bcrypt_rounds: int,
+    argon2_time_cost: int,
+    argon2_memory_cost: int,
+    argon2_parallelism: int,
+) -> CryptContext:
+    """
+    The create_crypt_context function builds the hashing policy.
+    New hashes use the first scheme; the others are only accepted for verification. A hash made with
+    another scheme or with other cost parameters is reported by needs_update, so it can be rehashed
+    on the next successful login.
+
+    :param schemes: list[str]: Scheme names, e.g. ["argon2", "bcrypt"]
+    :param bcrypt_rounds: int: bcrypt cost (log2 of the iteration count)
+    :param argon2_time_cost: int: argon2id passes over memory
+    :param argon2_memory_cost: int: argon2id memory in KiB
+    :param argon2_parallelism: int: argon2id lanes
+    :return: A CryptContext
+    """
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        bcrypt__min_desired_rounds=bcrypt_rounds,
+        bcrypt__max_desired_rounds=bcrypt_rounds,
+        argon2__type="ID",
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+
+_pwd_context = create_crypt_context(
+    settings.password_schemes,
+    settings.bcrypt_rounds,
+    settings.argon2_time_cost,
+    settings.argon2_memory_cost,
+    settings.argon2_parallelism,
+)
+
+
+def _hash(password: str) -> str:
+    return _pwd_context.hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return _pwd_context.verify(plain_password, hashed_password)
+
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return _pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def is_supported_hash(hashed_password: str) -> bool:
+    return _pwd_context.identify(hashed_password, required=False) is not None
+
+
+def _timed(func, *args):
+    # Выполняется в процессе пула: возвращает результат и чистое время работы func
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+class PasswordHasher:
+    """
+    Runs password hashing in a bounded process pool so it never blocks the event loop.
+    The number of calls waiting for or occupying a worker is reported as queue depth.
+    """
+
+    def __init__(self, workers: int = 0, max_pending: int = 0):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self._executor: ProcessPoolExecutor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.queue_depth = 0
+        self.calls = 0
+        self.total_time = 0.0
+        self.last_latency = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._semaphore = asyncio.Semaphore(self.max_pending)
+        return self._executor
+
+    async def _run(self, func, *args):
+        executor = self._get_executor()
+        op = func.__name__.lstrip("_")
+        self.queue_depth += 1
+        start = time.perf_counter()
+        duration = None
+        try:
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                result, duration = await loop.run_in_executor(
+                    executor, _timed, func, *args
+                )
+                return result
+        finally:
+            self.queue_depth -= 1
+            latency = time.perf_counter() - start
+            if duration is not None:
+                metrics.PASSWORD_HASH_DURATION.labels(op).observe(duration)
+                metrics.PASSWORD_HASH_WAIT.labels(op).observe(latency - duration)
+            self.calls += 1
+            self.total_time += latency
+            self.last_latency = latency
+            timing.record("bcrypt", latency)
+            logger.debug(
+                "%s took %.1f ms, queue depth %d",
+                op,
+                latency * 1000,
+                self.queue_depth,
+            )
+
+    async def hash(self, password: str) -> str:
+        """
+        The hash function hashes a password in a worker process.
+
+        :param self: Represent the instance of the class
+        :param password: str: The plain-text password
+        :return: The hash of the password under the current policy
+        """
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        The verify function checks a password against its hash in a worker process.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: The plain-text password
+        :param hashed_password: str: The stored hash
+        :return: True if the password matches the hash
+        """
+        return await self._run(_verify, plain_password, hashed_password)
+
+    async def verify_and_update(
+        self, plain_password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """
+        The verify_and_update function checks a password and, if it matches a hash made with an outdated
+        scheme or cost, also returns a new hash under the current policy.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: The plain-text password
+        :param hashed_password: str: The stored hash
+        :return: A tuple of whether the password matches and the replacement hash (or None)
+        """
+        return await self._run(_verify_and_update, plain_password, hashed_password)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "calls": self.calls,
+            "avg_latency": self.total_time / self.calls if self.calls else 0.0,
+            "last_latency": self.last_latency,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._semaphore = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.password_hash_workers,
+    max_pending=settings.password_hash_max_pending,
+)
+
+
+def _hash_time(context: CryptContext, samples: int) -> float:
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash("calibration-password")
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def calibrate_bcrypt(target: float, samples: int = 5) -> tuple[dict, float]:
+    """
+    The calibrate_bcrypt function finds the highest bcrypt cost whose hash time on this machine fits
+    the target. The cost stays within BCRYPT_MIN_ROUNDS..BCRYPT_MAX_ROUNDS.
+
+    :param target: float: The latency budget of one hash in seconds
+    :param samples: int: Hashes timed per candidate; the median is used
+    :return: A tuple of the chosen parameters and their measured hash time
+    """
+    rounds = BCRYPT_MIN_ROUNDS
+    elapsed = _hash_time(CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds), samples)
+    while rounds < BCRYPT_MAX_ROUNDS:
+        candidate = _hash_time(
+            CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds + 1), samples
+        )
+        if candidate > target:
+            break
+        rounds, elapsed = rounds + 1, candidate
+    return {"bcrypt_rounds": rounds}, elapsed
+
+
+def calibrate_argon2(
+    target: float, memory_cost: int, parallelism: int, samples: int = 5
+) -> tuple[dict, float]:
+    """
+    The calibrate_argon2 function finds argon2id parameters whose hash time on this machine fits the
+    target. Memory is kept at memory_cost and halved (down to ARGON2_MIN_MEMORY_COST) only if a
+    single pass does not fit; then time_cost is raised while it still fits, up to ARGON2_MAX_TIME_COST.
+
+    :param target: float: The latency budget of one hash in seconds
+    :param memory_cost: int: The preferred memory in KiB
+    :param parallelism: int: argon2id lanes
+    :param samples: int: Hashes timed per candidate; the median is used
+    :return: A tuple of the chosen parameters and their measured hash time
+    """
+
+    def measure(time_cost: int, memory: int) -> float:
+        context = CryptContext(
+            schemes=["argon2"],
+            argon2__type="ID",
+            argon2__time_cost=time_cost,
+            argon2__memory_cost=memory,
+            argon2__parallelism=parallelism,
+        )
+        return _hash_time(context, samples)
+
+    time_cost = 1
+    elapsed = measure(time_cost, memory_cost)
+    while elapsed > target and memory_cost // 2 >= ARGON2_MIN_MEMORY_COST:
+        memory_cost //= 2
+        elapsed = measure(time_cost, memory_cost)
+    while time_cost < ARGON2_MAX_TIME_COST:
+        candidate = measure(time_cost + 1, memory_cost)
+        if candidate > target:
+            break
+        time_cost, elapsed = time_cost + 1, candidate
+    return {
+        "argon2_time_cost": time_cost,
+        "argon2_memory_cost": memory_cost,
+        "argon2_parallelism": parallelism,
+    }, elapsed
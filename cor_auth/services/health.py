@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from cor_auth.conf.config import settings
+from cor_auth.database.db import SQLALCHEMY_ASYNC_DATABASE_URL, engine_options
+from cor_auth.services.logger import logger
+
+
+class HealthProbe:
+    """
+    Checks the database in the background and caches the result, so health and readiness requests
+    only read the last result. The probe has an engine with a single connection of its own:
+    orchestration probes never wait for, or take, a connection from the application pool.
+
+    :param url: str: The async database URL
+    :param interval: float: Seconds between checks
+    :param timeout: float: How long a check may take before the database is considered down
+    """
+
+    def __init__(self, url: str, interval: float, timeout: float):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.engine = None
+        self.healthy = False
+        self.error: str | None = None
+        self.latency = 0.0
+        self.checked_at: float | None = None
+        self._checked_monotonic: float | None = None
+
+    async def check(self) -> bool:
+        """
+        The check function runs SELECT 1 on the probe connection and stores the outcome.
+
+        :param self: Represent the instance of the class
+        :return: Whether the database answered within the timeout
+        """
+        if self.engine is None:
+            self.engine = create_async_engine(
+                self.url, **engine_options(self.url, async_driver=True, probe=True)
+            )
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._select_one(), self.timeout)
+            healthy, error = True, None
+        except asyncio.TimeoutError:
+            healthy, error = False, f"timed out after {self.timeout}s"
+        except Exception as e:
+            healthy, error = False, type(e).__name__
+            if self.healthy or self.checked_at is None:
+                logger.error("Database health check failed", exc_info=e)
+        if healthy and not self.healthy and self.checked_at is not None:
+            logger.info("Database health check recovered")
+        self.latency = time.perf_counter() - start
+        self.healthy, self.error = healthy, error
+        self.checked_at = time.time()
+        self._checked_monotonic = time.monotonic()
+        return healthy
+
+    async def _select_one(self) -> None:
+        async with self.engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    @property
+    def stale(self) -> bool:
+        # Фоновая проверка не выполнялась дольше трёх интервалов, результату верить нельзя
+        if self._checked_monotonic is None:
+            return True
+        return time.monotonic() - self._checked_monotonic > 3 * self.interval + self.timeout
+
+    def report(self) -> dict:
+        return {
+            "status": "ok" if self.healthy and not self.stale else "unavailable",
+            "database": {
+                "healthy": self.healthy,
+                "error": self.error,
+                "latency_ms": round(self.latency * 1000, 2),
+                "checked_at": self.checked_at,
+            },
+        }
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    async def close(self) -> None:
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+
+health_probe = HealthProbe(
+    SQLALCHEMY_ASYNC_DATABASE_URL,
+    interval=settings.health_probe_interval,
+    timeout=settings.health_probe_timeout,
+)
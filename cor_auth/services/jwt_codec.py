@@ -0,0 +1,180 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from jose import JWTError, jwt
+
+from cor_auth.conf.config import settings
+from cor_auth.services.keys import KeyRing, key_ring
+
+HMAC_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+RSA_HASHES = {"RS256": hashes.SHA256, "RS384": hashes.SHA384, "RS512": hashes.SHA512}
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _header_segment(algorithm: str, kid: str | None) -> str:
+    # Тот же заголовок, что строит python-jose: сортированные ключи, без пробелов
+    header = {"alg": algorithm, "typ": "JWT"}
+    if kid is not None:
+        header["kid"] = kid
+    return _b64encode(json.dumps(header, separators=(",", ":"), sort_keys=True).encode()).decode()
+
+
+class JoseCodec:
+    """
+    Encodes and verifies JWTs with python-jose, using the key objects pre-parsed by the key ring.
+    """
+
+    name = "jose"
+
+    def __init__(self, key_ring: KeyRing):
+        self.key_ring = key_ring
+
+    def encode(self, claims: dict) -> str:
+        kid, key = self.key_ring.signing_key
+        return jwt.encode(
+            claims,
+            key=key,
+            algorithm=self.key_ring.algorithm,
+            headers={"kid": kid} if kid else None,
+        )
+
+    def decode(self, token: str) -> dict:
+        return jwt.decode(
+            token,
+            key=self.key_ring.verification_key(token),
+            algorithms=self.key_ring.algorithm,
+        )
+
+
+class NativeCodec:
+    """
+    Encodes and verifies HS* and RS* JWTs directly with hmac and cryptography.
+    The encoded header segment of every key is built once, so issuing a token only serializes the
+    claims and signs; verification looks the key up by the raw header segment, so a header in the
+    form this service issues is never base64- or JSON-decoded. The codec rebuilds itself when the
+    key ring is reloaded. Tokens are byte-for-byte compatible with JoseCodec.
+    """
+
+    name = "native"
+
+    def __init__(self, key_ring: KeyRing):
+        self.key_ring = key_ring
+        self._version = None
+        self._signing_header = ""
+        self._signing_key = None
+        self._verification_keys: dict[str, object] = {}
+        self._keys_by_kid: dict[str | None, object] = {}
+
+    @classmethod
+    def supports(cls, algorithm: str) -> bool:
+        return algorithm in HMAC_DIGESTS or algorithm in RSA_HASHES
+
+    def _prepare(self) -> None:
+        kid, key = self.key_ring.signing_key
+        algorithm = self.key_ring.algorithm
+        self._signing_header = _header_segment(algorithm, kid)
+        self._signing_key = key.prepared_key
+        self._keys_by_kid = {
+            kid: key.prepared_key for kid, key in self.key_ring.verification_keys().items()
+        }
+        self._verification_keys = {
+            _header_segment(algorithm, kid): key for kid, key in self._keys_by_kid.items()
+        }
+        self._version = self.key_ring.version
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        algorithm = self.key_ring.algorithm
+        if algorithm in HMAC_DIGESTS:
+            return hmac.new(self._signing_key, signing_input, HMAC_DIGESTS[algorithm]).digest()
+        return self._signing_key.sign(signing_input, padding.PKCS1v15(), RSA_HASHES[algorithm]())
+
+    def _verify(self, key, signing_input: bytes, signature: bytes) -> bool:
+        algorithm = self.key_ring.algorithm
+        if algorithm in HMAC_DIGESTS:
+            expected = hmac.new(key, signing_input, HMAC_DIGESTS[algorithm]).digest()
+            return hmac.compare_digest(expected, signature)
+        try:
+            key.verify(signature, signing_input, padding.PKCS1v15(), RSA_HASHES[algorithm]())
+        except InvalidSignature:
+            return False
+        return True
+
+    def _key_from_header(self, header: str):
+        # Заголовок сериализован не так, как у нас (например, другим issuer-ом с тем же ключом)
+        fields = json.loads(_b64decode(header))
+        if not isinstance(fields, dict) or fields.get("alg") != self.key_ring.algorithm:
+            raise JWTError("Unexpected token algorithm")
+        if self.key_ring.symmetric:
+            # Как и python-jose, общий секрет проверяет токен независимо от kid
+            return self._keys_by_kid[None]
+        kid = fields.get("kid")
+        # kid приходит из непроверенного заголовка и может быть списком или объектом
+        key = self._keys_by_kid.get(kid) if isinstance(kid, str) else None
+        if key is None:
+            raise JWTError("Unknown key id")
+        return key
+
+    def encode(self, claims: dict) -> str:
+        if self._version != self.key_ring.version:
+            self._prepare()
+        payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode()).decode()
+        signing_input = f"{self._signing_header}.{payload}"
+        signature = _b64encode(self._sign(signing_input.encode())).decode()
+        return f"{signing_input}.{signature}"
+
+    def decode(self, token: str) -> dict:
+        if self._version != self.key_ring.version:
+            self._prepare()
+        try:
+            header, payload, signature = token.split(".")
+        except ValueError:
+            raise JWTError("Not enough segments")
+        try:
+            key = self._verification_keys.get(header) or self._key_from_header(header)
+            signature = _b64decode(signature)
+            if not self._verify(key, f"{header}.{payload}".encode(), signature):
+                raise JWTError("Signature verification failed")
+            claims = json.loads(_b64decode(payload))
+        except (binascii.Error, ValueError) as e:
+            raise JWTError("Invalid token") from e
+        if not isinstance(claims, dict):
+            raise JWTError("Invalid payload")
+        now = time.time()
+        exp = claims.get("exp")
+        if exp is not None and (not isinstance(exp, (int, float)) or exp <= now):
+            raise JWTError("Signature has expired")
+        nbf = claims.get("nbf")
+        if nbf is not None and (not isinstance(nbf, (int, float)) or nbf > now):
+            raise JWTError("The token is not yet valid")
+        return claims
+
+
+def create_codec(backend: str, key_ring: KeyRing):
+    """
+    The create_codec function returns the JWT codec selected by settings.jwt_backend.
+    The native codec covers HS* and RS*; other algorithms always use python-jose.
+
+    :param backend: str: native or jose
+    :param key_ring: KeyRing: The keys to sign and verify with
+    :return: A codec with encode(claims) and decode(token)
+    """
+    if backend == "native" and NativeCodec.supports(key_ring.algorithm):
+        return NativeCodec(key_ring)
+    return JoseCodec(key_ring)
+
+
+jwt_codec = create_codec(settings.jwt_backend, key_ring)
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+from pathlib import Path
+
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
+
+from cor_auth.conf.config import settings
+from cor_auth.services.logger import logger
+
+
+class KeyRing:
+    """
+    Holds the JWT keys as pre-parsed key objects.
+    With an HS* algorithm the ring has one key built from the shared secret. With RS*/ES* it
+    loads every PEM file in keys_dir: the file name (without .pem) is the kid, the newest kid in
+    sort order signs unless active_kid is set, and all keys, including public-only PEMs of retired
+    keys, verify. Public keys are published as a JWK set.
+    """
+
+    def __init__(self, algorithm: str, secret: str, keys_dir: str, active_kid: str | None = None):
+        self.algorithm = algorithm
+        self.secret = secret
+        self.keys_dir = keys_dir
+        self.active_kid = active_kid
+        self.symmetric = algorithm.startswith("HS")
+        self._keys: dict[str | None, Key] = {}
+        self._signing: tuple[str | None, Key] | None = None
+        self.jwks_json = b'{"keys": []}'
+        self.jwks_etag = ""
+        self.version = 0
+
+    def load(self) -> None:
+        """
+        The load function (re)reads the keys, so a new key can be added and activated without a restart.
+        The watch task calls it when the key directory changes; if the new keys are invalid, the old ones stay.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        if self.symmetric:
+            key = jwk.construct(self.secret, self.algorithm)
+            self._keys = {None: key}
+            self._signing = (None, key)
+            self._publish([])
+            self.version += 1
+            return
+
+        private_keys: dict[str, Key] = {}
+        public_keys: dict[str | None, Key] = {}
+        public_jwks = []
+        for path in sorted(Path(self.keys_dir).glob("*.pem")):
+            kid = path.stem
+            key = jwk.construct(path.read_bytes(), self.algorithm)
+            if not key.is_public():
+                private_keys[kid] = key
+                key = key.public_key()
+            public_keys[kid] = key
+            public_jwks.append({**key.to_dict(), "kid": kid, "use": "sig"})
+        if not private_keys:
+            raise RuntimeError(f"No private {self.algorithm} keys found in {self.keys_dir}")
+        active_kid = self.active_kid or list(private_keys)[-1]
+        if active_kid not in private_keys:
+            raise RuntimeError(f"Active key {active_kid} has no private key in {self.keys_dir}")
+        self._keys = public_keys
+        self._signing = (active_kid, private_keys[active_kid])
+        self._publish(public_jwks)
+        self.version += 1
+        logger.info("Loaded %d JWT keys, signing with %s", len(public_keys), active_kid)
+
+    def _publish(self, public_jwks: list[dict]) -> None:
+        self.jwks_json = json.dumps({"keys": public_jwks}, sort_keys=True).encode()
+        self.jwks_etag = '"' + hashlib.sha256(self.jwks_json).hexdigest()[:32] + '"'
+
+    @property
+    def signing_key(self) -> tuple[str | None, Key]:
+        """
+        The signing_key property returns the kid and key object that sign new tokens.
+
+        :param self: Represent the instance of the class
+        :return: A tuple of the kid (None for a shared secret) and the key
+        """
+        if self._signing is None:
+            self.load()
+        return self._signing
+
+    def verification_keys(self) -> dict[str | None, Key]:
+        """
+        The verification_keys function returns every key that verifies tokens, by kid.
+
+        :param self: Represent the instance of the class
+        :return: A dict of kid (None for a shared secret) to key object
+        """
+        if self._signing is None:
+            self.load()
+        return dict(self._keys)
+
+    def verification_key(self, token: str) -> Key:
+        """
+        The verification_key function picks the key matching the kid header of a token.
+
+        :param self: Represent the instance of the class
+        :param token: str: An encoded JWT
+        :return: The key object to verify the token with
+        """
+        if self._signing is None:
+            self.load()
+        if self.symmetric:
+            return self._keys[None]
+        kid = jwt.get_unverified_header(token).get("kid")
+        # kid приходит из непроверенного заголовка и может быть списком или объектом
+        key = self._keys.get(kid) if isinstance(kid, str) else None
+        if key is None:
+            raise JWTError("Unknown key id")
+        return key
+
+    def _snapshot(self) -> list[tuple[str, int, int]]:
+        snapshot = []
+        for path in sorted(Path(self.keys_dir).glob("*.pem")):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot.append((path.name, stat.st_mtime_ns, stat.st_size))
+        return snapshot
+
+    async def watch(self, interval: float) -> None:
+        """
+        The watch function polls keys_dir and reloads the ring when a PEM file is added, changed or removed.
+        It runs as a background task for the lifetime of the application; a shared secret is never reloaded.
+
+        :param self: Represent the instance of the class
+        :param interval: float: Seconds between checks of the key directory
+        :return: None
+        """
+        if self.symmetric:
+            return
+        snapshot = self._snapshot()
+        while True:
+            await asyncio.sleep(interval)
+            current = self._snapshot()
+            if current == snapshot:
+                continue
+            snapshot = current
+            try:
+                self.load()
+            except Exception as e:
+                logger.error("Failed to reload JWT keys, keeping the previous ones", exc_info=e)
+
+
+key_ring = KeyRing(
+    algorithm=settings.algorithm,
+    secret=settings.secret_key,
+    keys_dir=settings.jwt_keys_dir,
+    active_kid=settings.jwt_active_kid,
+)
@@ -1,7 +1,17 @@
+import atexit
+import json
 import logging
+import queue
+import random
 import sys
+from datetime import datetime, timezone
 from cor_auth.conf.config import settings
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
 
 DEBUG = settings.debug
 
@@ -12,6 +22,55 @@ else:
     logger.setLevel(logging.INFO)
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one JSON object per line. event is the unformatted message template,
+    so log lines of the same kind can be grouped without parsing the message.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "event": str(record.msg),
+            "message": record.getMessage(),
+            "module": record.module,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Drops a share of records per event (message template). Warnings and errors are never sampled.
+
+    :param rates: dict: Event template -> share of records to keep, from 0 to 1
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(record.msg)
+        return rate is None or random.random() < rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that puts the record on the queue as is. The stock prepare formats the message
+    in the calling thread; here formatting, JSON encoding and file I/O all happen in the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
 def handle_exception(exc_type, exc_value, exc_traceback):
     # Логирование информации об исключении
     logger.error(
@@ -23,12 +82,34 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 sys.excepthook = handle_exception
 
 
-file_handler = TimedRotatingFileHandler("logs.log", when="M", backupCount=7)
-file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s]: %(message)s"))
-logger.addHandler(file_handler)
+if settings.log_json:
+    log_formatter = JsonFormatter()
+else:
+    log_formatter = logging.Formatter("%(asctime)s [%(levelname)s]: %(message)s")
+
+if settings.log_rotation == "daily":
+    file_handler = TimedRotatingFileHandler(
+        settings.log_file, when="midnight", backupCount=settings.log_backup_count
+    )
+else:
+    file_handler = RotatingFileHandler(
+        settings.log_file,
+        maxBytes=settings.log_max_bytes,
+        backupCount=settings.log_backup_count,
+    )
+file_handler.setFormatter(log_formatter)
 
 
 stream_handler = logging.StreamHandler(sys.stdout)
-log_formatter = logging.Formatter("%(asctime)s [%(levelname)s]: %(message)s")
 stream_handler.setFormatter(log_formatter)
-logger.addHandler(stream_handler)
+
+
+# Обработчики пишут в отдельном потоке, event loop только кладёт запись в очередь
+log_queue = queue.SimpleQueue()
+queue_handler = DeferredQueueHandler(log_queue)
+queue_handler.addFilter(SamplingFilter(settings.log_sampling))
+logger.addHandler(queue_handler)
+
+log_listener = QueueListener(log_queue, file_handler, stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
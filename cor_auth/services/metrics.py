@@ -0,0 +1,157 @@
+import asyncio
+import os
+import time
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Если задан PROMETHEUS_MULTIPROC_DIR, каждый воркер пишет значения в свои mmap-файлы,
+# а /metrics суммирует их по всем воркерам
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+SLOW_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "cor_http_request_duration_seconds",
+    "Time spent handling a request, by route",
+    ["method", "route", "status"],
+    buckets=SLOW_BUCKETS,
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "cor_password_hash_duration_seconds",
+    "Time a worker process spent hashing or verifying a password",
+    ["op"],
+    buckets=SLOW_BUCKETS,
+)
+PASSWORD_HASH_WAIT = Histogram(
+    "cor_password_hash_queue_wait_seconds",
+    "Time a password hash or verify waited for a free worker process",
+    ["op"],
+    buckets=SLOW_BUCKETS,
+)
+JWT_DURATION = Histogram(
+    "cor_jwt_duration_seconds",
+    "Time spent encoding or decoding a JWT",
+    ["op"],
+    buckets=FAST_BUCKETS,
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "cor_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a database connection from the pool",
+    buckets=FAST_BUCKETS + SLOW_BUCKETS[4:],
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "cor_db_pool_checked_out",
+    "Database connections currently checked out of the pool",
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "cor_db_pool_overflow",
+    "Database connections open above the pool size",
+    multiprocess_mode="livesum",
+)
+EMAIL_QUEUE_DEPTH = Gauge(
+    "cor_email_queue_depth",
+    "Emails waiting to be sent",
+    multiprocess_mode="livesum",
+)
+PRINCIPAL_CACHE_REQUESTS = Counter(
+    "cor_principal_cache_requests",
+    "Principal cache lookups, by result",
+    ["result"],
+)
+
+# Дочерние метрики с метками создаются один раз, чтобы не искать их на каждом вызове
+JWT_ENCODE = JWT_DURATION.labels("encode")
+JWT_DECODE = JWT_DURATION.labels("decode")
+PRINCIPAL_CACHE_HIT = PRINCIPAL_CACHE_REQUESTS.labels("hit")
+PRINCIPAL_CACHE_MISS = PRINCIPAL_CACHE_REQUESTS.labels("miss")
+
+
+# Функции, которые обновляют gauge-метрики текущим состоянием пулов и очередей
+_samplers: list[Callable[[], None]] = []
+
+
+def sampler(func: Callable[[], None]) -> Callable[[], None]:
+    """
+    The sampler decorator registers a function that sets gauges from the current state of this worker.
+    Samplers run before every scrape and, in multiprocess mode, periodically in every worker.
+
+    :param func: Callable[[], None]: The function to register
+    :return: The same function
+    """
+    _samplers.append(func)
+    return func
+
+
+def sample() -> None:
+    for func in _samplers:
+        func()
+
+
+async def sample_periodically(interval: float) -> None:
+    while True:
+        sample()
+        await asyncio.sleep(interval)
+
+
+class MetricsRoute(APIRoute):
+    """
+    APIRoute that observes the handling time of every request in REQUEST_LATENCY,
+    labelled with the route template rather than the concrete path.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        method = ",".join(sorted(self.methods))
+        route = self.path_format
+
+        async def timed_handler(request: Request) -> Response:
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except Exception as e:
+                status = getattr(e, "status_code", 500)
+                raise
+            finally:
+                REQUEST_LATENCY.labels(method, route, status).observe(
+                    time.perf_counter() - start
+                )
+
+        return timed_handler
+
+
+def render() -> bytes:
+    """
+    The render function serializes all metrics in the Prometheus text format.
+    In multiprocess mode the values of all workers are aggregated.
+
+    :return: The metrics page body
+    """
+    sample()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead() -> None:
+    # Убираем значения livesum-метрик завершившегося воркера
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
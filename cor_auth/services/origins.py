@@ -0,0 +1,154 @@
+import asyncio
+import os
+from urllib.parse import urlsplit
+
+from cor_auth.conf.config import Settings, settings
+from cor_auth.services.logger import logger
+
+SCHEMES = ("http", "https")
+
+
+def _split_origin(origin: str) -> tuple[str, str, str] | None:
+    # "https://a.example.com:8443" -> ("https", "a.example.com", ":8443")
+    scheme, sep, authority = origin.partition("://")
+    if not sep or scheme not in SCHEMES or not authority or "/" in authority:
+        return None
+    host, colon, port = authority.rpartition(":")
+    if not colon or not port.isdigit():
+        host, port = authority, ""
+    else:
+        port = ":" + port
+    return scheme, host, port
+
+
+class _Rules:
+    """
+    An immutable compiled form of the allowed origins: a set for exact origins and a trie of
+    reversed host labels for "scheme://*.domain[:port]" wildcards.
+    """
+
+    __slots__ = ("exact", "wildcards", "patterns")
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = tuple(patterns)
+        self.exact: set[str] = set()
+        self.wildcards: dict = {}
+        for pattern in patterns:
+            pattern = pattern.strip().rstrip("/").lower()
+            parts = _split_origin(pattern)
+            if parts is None:
+                logger.warning("Ignoring invalid allowed origin %r", pattern)
+                continue
+            scheme, host, port = parts
+            if not host.startswith("*."):
+                self.exact.add(pattern)
+                continue
+            node = self.wildcards
+            for label in reversed(host[2:].split(".")):
+                node = node.setdefault(label, {})
+            # В листе храним допустимые пары (схема, порт) для поддоменов этого узла
+            node.setdefault(None, set()).add((scheme, port))
+
+    def allows(self, origin: str) -> bool:
+        origin = origin.lower()
+        if origin in self.exact:
+            return True
+        if not self.wildcards:
+            return False
+        parts = _split_origin(origin)
+        if parts is None:
+            return False
+        scheme, host, port = parts
+        labels = host.split(".")
+        if "" in labels:
+            return False
+        node = self.wildcards
+        # Последняя метка (сам поддомен) не может совпасть с шаблоном "*.domain" как домен
+        for label in reversed(labels[1:]):
+            node = node.get(label)
+            if node is None:
+                return False
+            if (scheme, port) in node.get(None, ()):
+                return True
+        return False
+
+
+class OriginPolicy:
+    """
+    The allowed origins for CORS and redirect URLs, compiled once for O(1) exact lookups and
+    per-label wildcard lookups. reload swaps the compiled rules with a single assignment, so
+    concurrent requests see either the old or the new policy, never a mix.
+    """
+
+    def __init__(self, patterns: list[str]):
+        self._rules = _Rules(patterns)
+
+    @property
+    def patterns(self) -> tuple[str, ...]:
+        return self._rules.patterns
+
+    def reload(self, patterns: list[str]) -> None:
+        self._rules = _Rules(patterns)
+
+    def allows_origin(self, origin: str) -> bool:
+        """
+        The allows_origin function checks an Origin header value against the policy.
+
+        :param self: Represent the instance of the class
+        :param origin: str: An origin such as https://app.example.com
+        :return: True if the origin is allowed
+        """
+        return self._rules.allows(origin)
+
+    def allows_url(self, url: str) -> bool:
+        """
+        The allows_url function checks that a redirect URL is http(s) and points to an allowed origin.
+
+        :param self: Represent the instance of the class
+        :param url: str: The redirect URL
+        :return: True if the URL may be redirected to
+        """
+        try:
+            parsed = urlsplit(url)
+        except ValueError:
+            return False
+        if parsed.scheme not in SCHEMES or not parsed.netloc or "@" in parsed.netloc:
+            return False
+        return self._rules.allows(f"{parsed.scheme}://{parsed.netloc}")
+
+    async def watch(self, interval: float) -> None:
+        """
+        The watch function polls the settings env file and reloads the policy when it changes.
+        It runs as a background task for the lifetime of the application.
+
+        :param self: Represent the instance of the class
+        :param interval: float: Seconds between checks of the file modification time
+        :return: None
+        """
+        path = Settings.model_config.get("env_file")
+        mtime = _mtime(path)
+        while True:
+            await asyncio.sleep(interval)
+            current = _mtime(path)
+            if current == mtime:
+                continue
+            mtime = current
+            try:
+                patterns = Settings().allowed_redirect_urls
+            except Exception as e:
+                logger.error("Failed to reload allowed origins", exc_info=e)
+                continue
+            if list(patterns) != list(self.patterns):
+                self.reload(patterns)
+                settings.allowed_redirect_urls = patterns
+                logger.info("Reloaded %d allowed origins from %s", len(patterns), path)
+
+
+def _mtime(path) -> float | None:
+    try:
+        return os.stat(path).st_mtime if path else None
+    except OSError:
+        return None
+
+
+origin_policy = OriginPolicy(settings.allowed_redirect_urls)
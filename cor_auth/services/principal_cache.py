@@ -0,0 +1,144 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from cor_auth.conf.config import settings
+from cor_auth.database.models import Role, User
+from cor_auth.services import metrics
+from cor_auth.services.logger import logger
+from cor_auth.services.redis_client import get_redis
+
+
+class Principal:
+    """
+    A compact, detached view of an authenticated user.
+    It carries only what access checks need, so cache entries stay small.
+    """
+
+    __slots__ = ("id", "email", "role")
+
+    def __init__(self, id: str, email: str, role: Role):
+        self.id = id
+        self.email = email
+        self.role = role
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(str(user.id), user.email, user.role)
+
+    def __repr__(self):
+        return f"Principal(id={self.id!r}, email={self.email!r}, role={self.role!r})"
+
+
+class PrincipalCache:
+    """
+    An in-process TTL + LRU cache of principals keyed by user id.
+    Entries expire after ttl seconds and the least recently used entry is evicted
+    once maxsize is reached. With a channel, invalidations are published over Redis
+    so that every worker drops the entry, not only the one that changed the user.
+    """
+
+    def __init__(self, ttl: float, maxsize: int, channel: str | None = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.channel = channel
+        self._entries: OrderedDict[str, tuple[float, Principal]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Principal | None:
+        """
+        The get function returns the cached principal for user_id, or None if it is missing or expired.
+
+        :param self: Represent the instance of the class
+        :param user_id: str: The id of the user
+        :return: A Principal or None
+        """
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            metrics.PRINCIPAL_CACHE_MISS.inc()
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        metrics.PRINCIPAL_CACHE_HIT.inc()
+        return entry[1]
+
+    def put(self, principal: Principal) -> None:
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+        self._entries.move_to_end(principal.id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id) -> None:
+        self._entries.pop(str(user_id), None)
+
+    async def invalidate_everywhere(self, user_id) -> None:
+        """
+        The invalidate_everywhere function drops a user from this cache and from the caches of all other workers.
+        It is called after a change that affects access checks, e.g. a new role.
+
+        :param self: Represent the instance of the class
+        :param user_id: The id of the user that changed
+        :return: None
+        """
+        self.invalidate(user_id)
+        if self.channel is None:
+            return
+        try:
+            await get_redis().publish(self.channel, str(user_id))
+        except Exception as e:
+            # Изменение уже закоммичено; другие воркеры увидят его не позже чем через ttl
+            logger.error("Failed to broadcast principal invalidation", exc_info=e)
+
+    async def listen(self, retry_interval: float = 1.0) -> None:
+        """
+        The listen function applies invalidations published by other workers.
+        It runs as a background task for the lifetime of the application. While the subscription
+        is down messages can be lost, so the whole cache is cleared after every reconnect.
+
+        :param self: Represent the instance of the class
+        :param retry_interval: float: Seconds to wait before resubscribing after an error
+        :return: None
+        """
+        failed = False
+        while True:
+            try:
+                async with get_redis().pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self.clear()
+                    if failed:
+                        logger.info("Principal invalidation channel reconnected")
+                        failed = False
+                    async for message in pubsub.listen():
+                        data = message["data"]
+                        self.invalidate(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if not failed:
+                    logger.error("Principal invalidation channel failed", exc_info=e)
+                    failed = True
+                self.clear()
+                await asyncio.sleep(retry_interval)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+principal_cache = PrincipalCache(
+    ttl=settings.principal_cache_ttl,
+    maxsize=settings.principal_cache_size,
+    channel="principal-cache:invalidate" if settings.principal_cache_broadcast else None,
+)
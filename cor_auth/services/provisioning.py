@@ -0,0 +1,121 @@
+import asyncio
+import csv
+import json
+from typing import IO, Iterable, Iterator
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cor_auth.database.models import Role
+from cor_auth.repository import users as repository_users
+from cor_auth.services.hashing import is_supported_hash, password_hasher
+from cor_auth.services.logger import logger
+
+FORMATS = ("csv", "ndjson")
+
+
+def read_rows(stream: IO[str], format: str) -> Iterator[tuple[int, dict]]:
+    """
+    The read_rows function parses users from a CSV file with a header row or from NDJSON.
+    Each row may have email, password (plain text), password_hash (bcrypt or argon2) and role.
+
+    :param stream: IO[str]: A text stream
+    :param format: str: csv or ndjson
+    :return: An iterator of (line number, row) pairs
+    """
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == "ndjson":
+        for line_num, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                row = None
+            yield line_num, row if isinstance(row, dict) else {}
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+
+
+def _chunks(rows: Iterable, size: int) -> Iterator[list]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _text(row: dict, field: str) -> str | None:
+    # В NDJSON значение может оказаться числом, списком или объектом
+    value = row.get(field)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value
+
+
+async def _prepare(line: int, row: dict) -> dict:
+    email = (_text(row, "email") or "").strip()
+    if "@" not in email:
+        raise ValueError("Invalid email")
+    role = _text(row, "role") or None
+    if role is not None:
+        if role not in Role.__members__:
+            raise ValueError(f"Invalid role: {role}")
+        role = Role[role]
+    password_hash = _text(row, "password_hash")
+    if password_hash:
+        if not is_supported_hash(password_hash):
+            raise ValueError("password_hash is not a supported hash")
+    else:
+        password = _text(row, "password") or ""
+        if not 6 <= len(password) <= 20:
+            raise ValueError("Password must be 6 to 20 characters long")
+        password_hash = await password_hasher.hash(password)
+    return {"line": line, "email": email, "password": password_hash, "role": role}
+
+
+async def import_users(
+    rows: Iterable[tuple[int, dict]], db: AsyncSession, chunk_size: int = 1000
+) -> dict:
+    """
+    The import_users function creates users in bulk.
+    Plain-text passwords of a chunk are hashed in parallel in the password hasher's process pool,
+    then the chunk is inserted with one executemany statement and committed. New users get the same
+    default role as create_user unless the row sets one.
+
+    :param rows: Iterable[tuple[int, dict]]: (line number, row) pairs, e.g. from read_rows
+    :param db: AsyncSession: Pass the database session to the function
+    :param chunk_size: int: The number of rows per transaction
+    :return: A report with the number of created users, the conflicting emails and the invalid rows
+    """
+    report = {"created": 0, "conflicts": [], "errors": []}
+    seen: set[str] = set()
+    for chunk in _chunks(rows, chunk_size):
+        results = await asyncio.gather(
+            *(_prepare(line, row) for line, row in chunk), return_exceptions=True
+        )
+        prepared = []
+        for (line, _), result in zip(chunk, results):
+            if isinstance(result, ValueError):
+                report["errors"].append({"line": line, "error": str(result)})
+            elif isinstance(result, Exception):
+                raise result
+            elif result["email"] in seen:
+                report["conflicts"].append({"line": line, "email": result["email"]})
+            else:
+                seen.add(result["email"])
+                prepared.append(result)
+        created = await repository_users.bulk_create_users(prepared, db)
+        report["created"] += len(created)
+        report["conflicts"].extend(
+            {"line": row["line"], "email": row["email"]}
+            for row in prepared
+            if row["email"] not in created
+        )
+        logger.debug("Imported %d users so far", report["created"])
+    return report
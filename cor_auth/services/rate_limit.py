@@ -0,0 +1,123 @@
+import time
+
+from cor_auth.conf.config import settings
+from cor_auth.services.redis_client import get_redis
+
+
+def _estimate(previous: int, current: int, offset: float, window: float) -> float:
+    # Скользящее окно: часть предыдущего окна, которая ещё попадает в последние window секунд
+    return previous * (1 - offset / window) + current
+
+
+class MemoryRateLimiter:
+    """
+    An in-process sliding-window counter. Each key costs one small tuple
+    (window index, previous count, current count); keys idle for two windows are evicted
+    every evict_every hits.
+    """
+
+    def __init__(self, window: float, evict_every: int = 1000):
+        self.window = window
+        self.evict_every = evict_every
+        self._counters: dict[str, tuple[int, int, int]] = {}
+        self._hits = 0
+
+    async def hit(self, key: str, limit: int) -> float:
+        """
+        The hit function counts an attempt for key unless the key is already over its limit.
+
+        :param self: Represent the instance of the class
+        :param key: str: What to limit, e.g. email:<address> or ip:<address>
+        :param limit: int: The number of attempts allowed per window
+        :return: 0 if the attempt is allowed, otherwise the number of seconds to wait
+        """
+        index, offset = divmod(time.monotonic(), self.window)
+        index = int(index)
+        entry = self._counters.get(key)
+        if entry is None or entry[0] < index - 1:
+            previous, current = 0, 0
+        elif entry[0] == index - 1:
+            previous, current = entry[2], 0
+        else:
+            previous, current = entry[1], entry[2]
+        if _estimate(previous, current, offset, self.window) >= limit:
+            return self.window - offset
+        self._counters[key] = (index, previous, current + 1)
+        self._hits += 1
+        if self._hits % self.evict_every == 0:
+            self._evict(index)
+        return 0
+
+    def _evict(self, index: int) -> None:
+        for key in [key for key, entry in self._counters.items() if entry[0] < index - 1]:
+            del self._counters[key]
+
+
+class RedisRateLimiter:
+    """
+    The same sliding-window counter kept in Redis, so all workers share the limits.
+    Each window is one INCR-ed key that expires after two windows.
+    """
+
+    def __init__(self, window: float, prefix: str = "ratelimit:"):
+        self.window = window
+        self.prefix = prefix
+
+    async def hit(self, key: str, limit: int) -> float:
+        index, offset = divmod(time.time(), self.window)
+        index = int(index)
+        current_key = f"{self.prefix}{key}:{index}"
+        previous_key = f"{self.prefix}{key}:{index - 1}"
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.get(previous_key)
+            pipe.get(current_key)
+            previous, current = await pipe.execute()
+        if _estimate(int(previous or 0), int(current or 0), offset, self.window) >= limit:
+            return self.window - offset
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.incr(current_key)
+            pipe.expire(current_key, int(self.window * 2))
+            await pipe.execute()
+        return 0
+
+
+class LoginThrottle:
+    """
+    Limits login attempts per client IP and per email before any database or bcrypt work is done.
+    """
+
+    def __init__(self, limiter, per_email: int, per_ip: int):
+        self.limiter = limiter
+        self.per_email = per_email
+        self.per_ip = per_ip
+
+    async def check(self, email: str, ip: str | None) -> float:
+        """
+        The check function counts a login attempt.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email the client is logging in with
+        :param ip: str | None: The client address
+        :return: 0 if the attempt may proceed, otherwise the number of seconds to wait
+        """
+        if ip is not None:
+            retry_after = await self.limiter.hit(f"ip:{ip}", self.per_ip)
+            if retry_after:
+                return retry_after
+        return await self.limiter.hit(f"email:{email.lower()}", self.per_email)
+
+
+def create_login_throttle() -> LoginThrottle:
+    window = settings.login_rate_limit_window
+    if settings.rate_limit_backend == "redis":
+        limiter = RedisRateLimiter(window)
+    else:
+        limiter = MemoryRateLimiter(window)
+    return LoginThrottle(
+        limiter,
+        per_email=settings.login_rate_limit_per_email,
+        per_ip=settings.login_rate_limit_per_ip,
+    )
+
+
+login_throttle = create_login_throttle()
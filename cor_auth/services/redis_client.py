@@ -0,0 +1,25 @@
+from redis import asyncio as aioredis
+
+from cor_auth.conf.config import settings
+
+_client: aioredis.Redis | None = None
+
+
+def get_redis() -> aioredis.Redis:
+    """
+    The get_redis function returns the process-wide Redis client, creating it on first use.
+    The client keeps its own connection pool, so it is shared by every service that needs Redis.
+
+    :return: A redis.asyncio.Redis client for settings.redis_url
+    """
+    global _client
+    if _client is None:
+        _client = aioredis.from_url(settings.redis_url)
+    return _client
+
+
+async def close_redis() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
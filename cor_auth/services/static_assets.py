@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse, Response
+from starlette.types import Receive, Scope, Send
+
+from cor_auth.services.logger import logger
+
+try:
+    import brotli
+except ImportError:  # brotli объявлен в зависимостях; без него отдаём только gzip
+    brotli = None
+
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+REFERENCE = re.compile(r'(?P<attr>\b(?:src|href)=")(?P<prefix>/?(?:static/)?)(?P<name>[^"/?#]+)"')
+
+
+class Asset:
+    """
+    One file held in memory with its precompressed variants. Each variant is
+    (body, strong ETag); the ETag includes the encoding, since the bodies differ.
+    """
+
+    __slots__ = ("media_type", "variants", "cache_control")
+
+    def __init__(self, media_type: str, body: bytes, cache_control: str, compress_min_size: int):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants: dict[str, tuple[bytes, str]] = {"identity": (body, f'"{digest}"')}
+        if len(body) < compress_min_size or not media_type.startswith(COMPRESSIBLE):
+            return
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gzipped) < len(body):
+            self.variants["gzip"] = (gzipped, f'"{digest}-gz"')
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                self.variants["br"] = (compressed, f'"{digest}-br"')
+
+
+class StaticAssets:
+    """
+    Serves the static directory from memory. At load every file is read once, compressed with
+    gzip (and brotli when installed) and given a fingerprinted alias (styles.<hash>.css) cached as
+    immutable; HTML pages have their references rewritten to the fingerprinted names and are
+    served with no-cache, so browsers revalidate them with the strong ETag and get a 304.
+    """
+
+    def __init__(self, directory: str, compress_min_size: int = 256):
+        self.directory = directory
+        self.compress_min_size = compress_min_size
+        self._assets: dict[str, Asset] = {}
+        self.fingerprints: dict[str, str] = {}
+
+    def load(self) -> None:
+        """
+        The load function reads, fingerprints and compresses every file in the directory.
+
+        :param self: Represent the instance of the class
+        :return: None
+        """
+        root = Path(self.directory)
+        files = sorted(path for path in root.rglob("*") if path.is_file())
+        assets: dict[str, Asset] = {}
+        fingerprints: dict[str, str] = {}
+        pages = []
+        for path in files:
+            name = path.relative_to(root).as_posix()
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            if media_type == "text/html":
+                pages.append((name, path))
+                continue
+            body = path.read_bytes()
+            assets[name] = Asset(media_type, body, REVALIDATE, self.compress_min_size)
+            stem, dot, suffix = name.rpartition(".")
+            digest = hashlib.sha256(body).hexdigest()[:12]
+            fingerprinted = f"{stem}.{digest}.{suffix}" if dot else f"{name}.{digest}"
+            assets[fingerprinted] = Asset(media_type, body, IMMUTABLE, self.compress_min_size)
+            fingerprints[name] = fingerprinted
+
+        def fingerprint(match: re.Match) -> str:
+            name = fingerprints.get(match["name"], match["name"])
+            return f'{match["attr"]}{match["prefix"]}{name}"'
+
+        for name, path in pages:
+            html = REFERENCE.sub(fingerprint, path.read_text(encoding="utf-8"))
+            assets[name] = Asset(
+                "text/html; charset=utf-8", html.encode(), REVALIDATE, self.compress_min_size
+            )
+        self._assets = assets
+        self.fingerprints = fingerprints
+        if brotli is None:
+            logger.warning("brotli is not installed, static assets are served with gzip only")
+        logger.info("Loaded %d static assets from %s", len(files), self.directory)
+
+    def response(self, name: str, headers: Headers, method: str = "GET") -> Response:
+        """
+        The response function builds the response for an asset, picking the best encoding the
+        client accepts and answering 304 when its cached copy is still current.
+
+        :param self: Represent the instance of the class
+        :param name: str: The asset path relative to the static directory
+        :param headers: Headers: The request headers
+        :param method: str: GET or HEAD
+        :return: The response with the asset, a 304 or a 404
+        """
+        if not self._assets:
+            self.load()
+        asset = self._assets.get(name)
+        if asset is None:
+            return PlainTextResponse("Not Found", status_code=404)
+        encoding = _choose_encoding(headers.get("accept-encoding", ""), asset.variants)
+        body, etag = asset.variants[encoding]
+        response_headers = {
+            "ETag": etag,
+            "Cache-Control": asset.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if _etag_matches(headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=response_headers)
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        if method == "HEAD":
+            response_headers["Content-Length"] = str(len(body))
+            body = b""
+        return Response(body, media_type=asset.media_type, headers=response_headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405)
+        else:
+            name = scope["path"][len(scope.get("root_path", "")):].lstrip("/")
+            response = self.response(name, Headers(scope=scope), scope["method"])
+        await response(scope, receive, send)
+
+
+def _choose_encoding(accept_encoding: str, variants: dict) -> str:
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in variants and (encoding in accepted or "*" in accepted):
+            return encoding
+    return "identity"
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+static_assets = StaticAssets("cor_auth/static")
@@ -0,0 +1,38 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+
+# Длительности фаз текущего запроса в секундах, None вне запроса
+_phases: ContextVar[dict[str, float] | None] = ContextVar("server_timing", default=None)
+
+
+def begin() -> tuple[dict[str, float], Token]:
+    phases: dict[str, float] = {}
+    return phases, _phases.set(phases)
+
+
+def end(token: Token) -> None:
+    _phases.reset(token)
+
+
+def record(name: str, seconds: float) -> None:
+    """
+    The record function adds seconds to the named phase of the current request.
+    Outside of a request it does nothing.
+
+    :param name: str: The phase name, e.g. db or jwt
+    :param seconds: float: The measured duration
+    :return: None
+    """
+    phases = _phases.get()
+    if phases is not None:
+        phases[name] = phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
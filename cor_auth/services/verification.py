@@ -0,0 +1,118 @@
+import time
+
+from cor_auth.conf.config import settings
+from cor_auth.services.redis_client import get_redis
+
+
+class MemoryVerificationStore:
+    """
+    Keeps verification codes in process memory with a TTL and an attempt counter.
+    Only suitable for a single worker: codes issued by one process are invisible to the others.
+    """
+
+    def __init__(self, ttl: int, max_attempts: int, purge_every: int = 1000):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.purge_every = purge_every
+        self._codes: dict[str, list] = {}
+        self._issued = 0
+
+    async def issue(self, email: str, code: int) -> None:
+        """
+        The issue function stores a new code for an email, replacing any previous one.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email the code was sent to
+        :param code: int: The verification code
+        :return: None
+        """
+        self._codes[email] = [code, 0, time.monotonic() + self.ttl]
+        self._issued += 1
+        if self._issued % self.purge_every == 0:
+            self._purge()
+
+    async def verify(self, email: str, code: int) -> bool:
+        """
+        The verify function checks a code. A matching code is consumed; a wrong one counts as an attempt,
+        and the code is dropped after max_attempts wrong guesses.
+
+        :param self: Represent the instance of the class
+        :param email: str: The email the code was sent to
+        :param code: int: The code entered by the user
+        :return: True if the code is correct and has not expired
+        """
+        entry = self._codes.get(email)
+        if entry is None:
+            return False
+        if entry[2] < time.monotonic():
+            del self._codes[email]
+            return False
+        if entry[0] == code:
+            del self._codes[email]
+            return True
+        entry[1] += 1
+        if entry[1] >= self.max_attempts:
+            del self._codes[email]
+        return False
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for email in [email for email, entry in self._codes.items() if entry[2] < now]:
+            del self._codes[email]
+
+
+class RedisVerificationStore:
+    """
+    Keeps verification codes in Redis (or anything speaking its protocol) as hashes with a native TTL.
+    The check and the attempt counter are updated atomically by a Lua script.
+    """
+
+    VERIFY_SCRIPT = """
+local code = redis.call('HGET', KEYS[1], 'code')
+if not code then
+    return 0
+end
+if code == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+if redis.call('HINCRBY', KEYS[1], 'attempts', 1) >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, ttl: int, max_attempts: int, prefix: str = "verification:"):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+        self._verify = None
+
+    async def issue(self, email: str, code: int) -> None:
+        key = self.prefix + email
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={"code": str(code), "attempts": 0})
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+
+    async def verify(self, email: str, code: int) -> bool:
+        if self._verify is None:
+            self._verify = get_redis().register_script(self.VERIFY_SCRIPT)
+        result = await self._verify(
+            keys=[self.prefix + email], args=[str(code), self.max_attempts]
+        )
+        return result == 1
+
+
+def create_verification_store():
+    if settings.verification_backend == "redis":
+        return RedisVerificationStore(
+            settings.verification_code_ttl, settings.verification_max_attempts
+        )
+    return MemoryVerificationStore(
+        settings.verification_code_ttl, settings.verification_max_attempts
+    )
+
+
+verification_store = create_verification_store()
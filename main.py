@@ -1,45 +1,66 @@
-import time
-
+import asyncio
 import uvicorn
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from fastapi import FastAPI, Request, Depends, HTTPException, status, Request, Query
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
-import hashlib
-import hmac
-
-from cor_auth.routes import auth
-from cor_auth.database.db import get_db
+from fastapi import FastAPI, Request, HTTPException, status
+from fastapi.responses import Response
+
+from cor_auth.database.db import async_engine, pool_stats, replica_engines, AsyncSessionLocal
 from cor_auth.routes import auth, users
-from cor_auth.repository import users as repo_users
+from cor_auth.repository import tokens as repository_tokens
 from cor_auth.conf.config import settings
 from cor_auth.services.logger import logger
 from cor_auth.services.auth import auth_service
+from cor_auth.services.keys import key_ring
+from cor_auth.services.origins import origin_policy
+from cor_auth.services.static_assets import static_assets
+from cor_auth.services.redis_client import close_redis
+from cor_auth.services.hashing import password_hasher
+from cor_auth.services.email import mail_worker
+from cor_auth.services import metrics
+from cor_auth.services.health import health_probe
+from cor_auth.services.principal_cache import principal_cache
+from cor_auth.middleware.cors import PolicyCORSMiddleware
+from cor_auth.middleware.signature import SignatureVerificationMiddleware
+from cor_auth.middleware.server_timing import ServerTimingMiddleware, TimedJSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 
 
-app = FastAPI()
-app.mount("/static", StaticFiles(directory="cor_auth/static"), name="static")
-
-origins = settings.allowed_redirect_urls
+app = FastAPI(default_response_class=TimedJSONResponse)
+app.mount("/static", static_assets, name="static")
 
 # Middleware для CORS
 app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
+    PolicyCORSMiddleware,
+    policy=origin_policy,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+# Middleware для проверки подписи
+app.add_middleware(
+    SignatureVerificationMiddleware,
+    key=settings.signing_key,
+    max_body_size=settings.signing_max_body_size,
+    enabled=settings.signing_key_verification,
+)
+
+# Middleware для заголовка Server-Timing
+app.add_middleware(
+    ServerTimingMiddleware,
+    enabled=settings.server_timing_enabled,
+    log_sample_rate=settings.server_timing_log_sample_rate,
+)
+
 
 # Обработчики исключений
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers=exc.headers,
+    )
 
 
 @app.exception_handler(Exception)
@@ -73,7 +94,7 @@ def read_root(request: Request,
     if not auth_service.is_valid_redirect_url(redirectUrl):
         raise HTTPException(status_code=400, detail="Invalid redirect URL")
     
-    return FileResponse(path="cor_auth/static/login.html")
+    return static_assets.response("login.html", request.headers, request.method)
 
 
 @app.get("/config")
@@ -81,6 +102,26 @@ def read_config():
     return {"ENV": settings.app_env}
 
 
+@app.get("/.well-known/jwks.json", name="JWKS")
+def read_jwks(request: Request):
+    headers = {
+        "ETag": key_ring.jwks_etag,
+        "Cache-Control": f"public, max-age={settings.jwks_max_age}",
+    }
+    if request.headers.get("if-none-match") == key_ring.jwks_etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(
+        content=key_ring.jwks_json, media_type="application/json", headers=headers
+    )
+
+
+if settings.metrics_enabled:
+
+    @app.get("/metrics", include_in_schema=False)
+    def read_metrics():
+        return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+
 @app.get("/get_social_login_settings", name="social login settings")
 def get_login_settings():
     return JSONResponse(
@@ -91,76 +132,27 @@ def get_login_settings():
 
 
 @app.get("/api/healthchecker")
-def healthchecker(db: Session = Depends(get_db)):
-    try:
-        result = db.execute(text("SELECT 1")).fetchone()
-        if result is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Database is not configured correctly",
-            )
-        return {"message": "Welcome to FastApi, database work correctly"}
-    except Exception as e:
-        logger.error("Database connection error", exc_info=e)
+def healthchecker():
+    # Результат фоновой проверки: запрос не берёт соединение из пула приложения
+    if not health_probe.healthy or health_probe.stale:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Error connecting to the database",
         )
+    return {"message": "Welcome to FastApi, database work correctly"}
 
 
-
-# Middleware для проверки подписи
-@app.middleware("http")
-async def verify_request_signature(request: Request, call_next):
-    if settings.signing_key_verification:
-        try:
-            signature = request.headers.get("X-Signature")
-            if signature is None:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing signature"
-                )
-
-            body = await request.body()
-            body_str = body.decode()
-
-            if not verify_signature(body_str, signature):
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature"
-                )
-
-            return await call_next(request)
-        except HTTPException as exc:
-            return JSONResponse(
-                status_code=exc.status_code, content={"detail": exc.detail}
-            )
-    else:
-        return await call_next(request)
-
-
-def verify_signature(body: str, signature: str) -> bool:
-    computed_signature = hmac.new(
-        settings.signing_key, body.encode(), hashlib.sha256
-    ).hexdigest()
-    return hmac.compare_digest(
-        computed_signature.encode("utf-8"), signature.encode("utf-8")
+@app.get("/api/readiness")
+def readiness():
+    report = health_probe.report()
+    report["pool"] = pool_stats.snapshot(async_engine.pool)
+    ready = report["status"] == "ok"
+    return JSONResponse(
+        content=report,
+        status_code=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE,
     )
 
 
-# def create_signature(signing_key: str, body: str) -> str:
-#     signature = hmac.new(settings.signing_key.encode(), body.encode(), hashlib.sha256).hexdigest()
-#     return signature
-
-
-
-# Middleware для добавления заголовка времени обработки
-@app.middleware("http")
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
-    response = await call_next(request)
-    process_time = time.time() - start_time
-    response.headers["My-Process-Time"] = str(process_time)
-    return response
-
 
 # Событие при старте приложения
 # @app.on_event("startup")
@@ -168,6 +160,19 @@ async def add_process_time_header(request: Request, call_next):
 #     print("------------- STARTUP --------------")
 
 
+async def prune_refresh_tokens(interval: float, batch_size: int) -> None:
+    # Истёкшие семейства refresh-токенов удаляются в фоне, чтобы таблица не росла бесконечно
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                deleted = await repository_tokens.prune_expired(db, batch_size)
+            if deleted:
+                logger.info("Pruned %d expired refresh tokens", deleted)
+        except Exception as e:
+            logger.error("Failed to prune refresh tokens", exc_info=e)
+        await asyncio.sleep(interval)
+
+
 from contextlib import asynccontextmanager
 # Обработчики событий жизненного цикла
 @asynccontextmanager
@@ -175,8 +180,55 @@ async def lifespan(app: FastAPI):
     # Код, который выполняется при запуске приложения
     print("------------- STARTUP --------------")
     logger.info("Application startup")
+    key_ring.load()
+    static_assets.load()
+    await mail_worker.start()
+    await health_probe.check()
+    health_checker = asyncio.create_task(health_probe.run())
+    principal_listener = None
+    if principal_cache.channel is not None:
+        principal_listener = asyncio.create_task(principal_cache.listen())
+    token_pruner = None
+    if settings.refresh_token_prune_interval > 0:
+        token_pruner = asyncio.create_task(
+            prune_refresh_tokens(
+                settings.refresh_token_prune_interval, settings.refresh_token_prune_batch_size
+            )
+        )
+    origins_watcher = None
+    if settings.origins_reload_interval > 0:
+        origins_watcher = asyncio.create_task(
+            origin_policy.watch(settings.origins_reload_interval)
+        )
+    keys_watcher = None
+    if settings.jwt_keys_reload_interval > 0:
+        keys_watcher = asyncio.create_task(key_ring.watch(settings.jwt_keys_reload_interval))
+    metrics_sampler = None
+    if settings.metrics_enabled and metrics.MULTIPROCESS:
+        metrics_sampler = asyncio.create_task(
+            metrics.sample_periodically(settings.metrics_sample_interval)
+        )
     yield
     # Код, который выполняется при остановке приложения
+    health_checker.cancel()
+    if principal_listener is not None:
+        principal_listener.cancel()
+    if token_pruner is not None:
+        token_pruner.cancel()
+    if metrics_sampler is not None:
+        metrics_sampler.cancel()
+    if origins_watcher is not None:
+        origins_watcher.cancel()
+    if keys_watcher is not None:
+        keys_watcher.cancel()
+    await mail_worker.stop()
+    password_hasher.shutdown()
+    await async_engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
+    await health_probe.close()
+    await close_redis()
+    metrics.mark_process_dead()
     logger.info("Application shutdown")
 
 app.router.lifespan_context = lifespan
@@ -188,6 +240,7 @@ app.router.lifespan_context = lifespan
 
 
 app.include_router(auth.router, prefix="/api")
+app.include_router(users.router, prefix="/api")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,43 @@
+import os
+import tempfile
+
+# Настройки читаются при импорте cor_auth, поэтому окружение задаётся до него
+os.environ.setdefault("SECRET_KEY", "test-secret-key-0123456789abcdef0123")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "cor-auth-tests.log"))
+os.environ.setdefault("PRINCIPAL_CACHE_BROADCAST", "false")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(monkeypatch):
+    """
+    A session on an empty schema in TEST_DATABASE_URL (PostgreSQL); the tests that need it are skipped without one.
+    """
+    url = os.getenv("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.pool import NullPool
+
+    from cor_auth.database.db import async_database_url
+    from cor_auth.database.models import Base, Bootstrap
+    from cor_auth.repository import users as repository_users
+
+    monkeypatch.setattr(repository_users, "_admin_claimed", False)
+    engine = create_async_engine(async_database_url(url), poolclass=NullPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(Bootstrap(id=1, admin_claimed=False))
+        await session.commit()
+        yield session
+    await engine.dispose()
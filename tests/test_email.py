@@ -0,0 +1,49 @@
+import asyncio
+
+import pytest
+
+from cor_auth.services.email import MailDeliveryWorker
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSMTP:
+    def __init__(self):
+        self.is_connected = True
+        self.messages = []
+
+    async def send_message(self, message):
+        self.messages.append(message)
+
+    async def quit(self):
+        self.is_connected = False
+
+
+@pytest.fixture
+def smtp():
+    return FakeSMTP()
+
+
+@pytest.fixture
+async def worker(smtp, monkeypatch):
+    worker = MailDeliveryWorker(
+        pool_size=1, queue_size=2, batch_size=10, max_retries=0, retry_backoff=0
+    )
+    async def connect():
+        return smtp
+
+    monkeypatch.setattr(worker, "_connect", connect)
+    yield worker
+    await worker.stop(timeout=1)
+
+
+async def test_broken_message_does_not_stop_consumer(worker, smtp):
+    await worker.enqueue("a@example.com", "Broken", "missing_template.html", {})
+    await worker.enqueue("b@example.com", "Code", "email_templates.html", {"host": "h", "code": 1})
+    await asyncio.wait_for(worker.queue.join(), 1)
+
+    assert worker.failed == 1
+    assert worker.sent == 1
+    assert [m["To"] for m in smtp.messages] == ["b@example.com"]
+    assert not any(task.done() for task in worker._tasks)
+
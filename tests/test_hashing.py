@@ -0,0 +1,61 @@
+import pytest
+
+from cor_auth.services import hashing
+from cor_auth.services.hashing import (
+    ARGON2_MAX_TIME_COST,
+    ARGON2_MIN_MEMORY_COST,
+    BCRYPT_MAX_ROUNDS,
+    BCRYPT_MIN_ROUNDS,
+    calibrate_argon2,
+    calibrate_bcrypt,
+)
+
+
+def cost_model(monkeypatch, seconds):
+    # Вместо настоящего хеширования время считается по параметрам контекста
+    def hash_time(context, samples):
+        return seconds(context.to_dict())
+
+    monkeypatch.setattr(hashing, "_hash_time", hash_time)
+
+
+def test_bcrypt_stops_at_max_rounds(monkeypatch):
+    cost_model(monkeypatch, lambda params: 0.0)
+
+    params, elapsed = calibrate_bcrypt(target=0.25)
+
+    assert params == {"bcrypt_rounds": BCRYPT_MAX_ROUNDS}
+    assert elapsed == 0.0
+
+
+@pytest.mark.parametrize("target, rounds", [(0.001, BCRYPT_MIN_ROUNDS), (0.25, 12), (0.5, 13)])
+def test_bcrypt_highest_cost_within_target(monkeypatch, target, rounds):
+    cost_model(monkeypatch, lambda params: 0.06 * 2 ** (params["bcrypt__rounds"] - 10))
+
+    assert calibrate_bcrypt(target)[0] == {"bcrypt_rounds": rounds}
+
+
+def test_argon2_stops_at_max_time_cost(monkeypatch):
+    cost_model(monkeypatch, lambda params: 0.0)
+
+    params, _ = calibrate_argon2(target=0.25, memory_cost=65536, parallelism=4)
+
+    assert params["argon2_time_cost"] == ARGON2_MAX_TIME_COST
+    assert params["argon2_memory_cost"] == 65536
+
+
+def test_argon2_halves_memory_before_raising_time_cost(monkeypatch):
+    cost_model(
+        monkeypatch,
+        lambda params: 0.1 * params["argon2__time_cost"] * params["argon2__memory_cost"] / 65536,
+    )
+
+    params, elapsed = calibrate_argon2(target=0.08, memory_cost=65536, parallelism=4)
+
+    assert params == {
+        "argon2_time_cost": 1,
+        "argon2_memory_cost": 32768,
+        "argon2_parallelism": 4,
+    }
+    assert elapsed == pytest.approx(0.05)
+    assert params["argon2_memory_cost"] >= ARGON2_MIN_MEMORY_COST
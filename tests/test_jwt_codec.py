@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError
+
+from cor_auth.services.jwt_codec import JoseCodec, NativeCodec
+from cor_auth.services.keys import KeyRing
+
+SECRET = "test-secret-key-0123456789abcdef0123"
+
+
+def b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def segment(data) -> str:
+    return b64(json.dumps(data, separators=(",", ":")).encode())
+
+
+def write_key(keys_dir, kid: str) -> None:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    (keys_dir / f"{kid}.pem").write_bytes(pem)
+
+
+@pytest.fixture(params=["HS256", "RS256"])
+def ring(request, tmp_path):
+    if request.param == "RS256":
+        write_key(tmp_path, "2024-01")
+        write_key(tmp_path, "2024-02")
+    ring = KeyRing(request.param, SECRET, str(tmp_path))
+    ring.load()
+    return ring
+
+
+@pytest.fixture(params=["jose", "native"])
+def codec(request, ring):
+    return JoseCodec(ring) if request.param == "jose" else NativeCodec(ring)
+
+
+def claims(**extra) -> dict:
+    return {"sub": "user@example.com", "oid": "1", "scope": "access_token", **extra}
+
+
+def test_tokens_are_identical(ring):
+    token_claims = claims(exp=int(time.time()) + 60, iat=int(time.time()))
+
+    assert NativeCodec(ring).encode(token_claims) == JoseCodec(ring).encode(token_claims)
+
+
+def test_decodes_each_other(ring):
+    jose, native = JoseCodec(ring), NativeCodec(ring)
+    token_claims = claims(exp=int(time.time()) + 60)
+
+    assert native.decode(jose.encode(token_claims)) == token_claims
+    assert jose.decode(native.encode(token_claims)) == token_claims
+
+
+def test_retired_key_still_verifies(tmp_path):
+    write_key(tmp_path, "2024-01")
+    ring = KeyRing("RS256", SECRET, str(tmp_path))
+    ring.load()
+    token = JoseCodec(ring).encode(claims())
+    write_key(tmp_path, "2024-02")
+    ring.load()
+
+    assert ring.signing_key[0] == "2024-02"
+    assert NativeCodec(ring).decode(token) == claims()
+
+
+def test_expired_token_rejected(codec):
+    token = codec.encode(claims(exp=int(time.time()) - 5))
+
+    with pytest.raises(JWTError):
+        codec.decode(token)
+
+
+def test_not_yet_valid_token_rejected(codec):
+    token = codec.encode(claims(nbf=int(time.time()) + 60))
+
+    with pytest.raises(JWTError):
+        codec.decode(token)
+
+
+def test_tampered_payload_rejected(codec):
+    header, _, signature = codec.encode(claims()).split(".")
+    token = ".".join([header, segment(claims(sub="admin@example.com")), signature])
+
+    with pytest.raises(JWTError):
+        codec.decode(token)
+
+
+def test_alg_none_rejected(codec, ring):
+    kid = ring.signing_key[0]
+    header = {"alg": "none", "typ": "JWT", **({"kid": kid} if kid else {})}
+    token = f"{segment(header)}.{segment(claims())}."
+
+    with pytest.raises(JWTError):
+        codec.decode(token)
+
+
+def test_hmac_with_public_key_rejected(tmp_path):
+    # Классическая подмена алгоритма: HS256, подписанный публичным RSA-ключом как секретом
+    write_key(tmp_path, "2024-01")
+    ring = KeyRing("RS256", SECRET, str(tmp_path))
+    ring.load()
+    public_pem = ring.signing_key[1].public_key().to_pem()
+    signing_input = f"{segment({'alg': 'HS256', 'kid': '2024-01', 'typ': 'JWT'})}.{segment(claims())}"
+    signature = b64(hmac.new(public_pem, signing_input.encode(), hashlib.sha256).digest())
+    token = f"{signing_input}.{signature}"
+
+    for codec in (JoseCodec(ring), NativeCodec(ring)):
+        with pytest.raises(JWTError):
+            codec.decode(token)
+
+
+@pytest.mark.parametrize("kid", [["2024-01"], {"kid": "2024-01"}, 1, "unknown"])
+def test_malformed_or_unknown_kid_rejected(tmp_path, kid):
+    write_key(tmp_path, "2024-01")
+    ring = KeyRing("RS256", SECRET, str(tmp_path))
+    ring.load()
+    _, payload, signature = JoseCodec(ring).encode(claims()).split(".")
+    token = f"{segment({'alg': 'RS256', 'kid': kid, 'typ': 'JWT'})}.{payload}.{signature}"
+
+    for codec in (JoseCodec(ring), NativeCodec(ring)):
+        with pytest.raises(JWTError):
+            codec.decode(token)
+
+
+@pytest.mark.parametrize("token", ["", "a.b", "a.b.c.d", "!!!.@@@.###", "e30.e30.e30"])
+def test_garbage_rejected(codec, token):
+    with pytest.raises(JWTError):
+        codec.decode(token)
+
+
+def test_shared_secret_ignores_kid():
+    ring = KeyRing("HS256", SECRET, "")
+    ring.load()
+    signing_input = f"{segment({'typ': 'JWT', 'alg': 'HS256', 'kid': 'other'})}.{segment(claims())}"
+    signature = b64(hmac.new(SECRET.encode(), signing_input.encode(), hashlib.sha256).digest())
+    token = f"{signing_input}.{signature}"
+
+    assert JoseCodec(ring).decode(token) == NativeCodec(ring).decode(token) == claims()
@@ -0,0 +1,81 @@
+import asyncio
+import base64
+import json
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError, jwt
+
+from cor_auth.services.keys import KeyRing
+
+
+def write_key(keys_dir, kid: str) -> str:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    (keys_dir / f"{kid}.pem").write_bytes(pem)
+    return pem.decode()
+
+
+def b64(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+
+@pytest.fixture
+def ring(tmp_path):
+    write_key(tmp_path, "2024-01")
+    ring = KeyRing("RS256", "unused", str(tmp_path))
+    ring.load()
+    return ring
+
+
+def test_verification_key_by_kid(ring, tmp_path):
+    kid, key = ring.signing_key
+    token = jwt.encode({"sub": "a"}, key, algorithm="RS256", headers={"kid": kid})
+
+    assert kid == "2024-01"
+    assert ring.verification_key(token).to_dict() == key.public_key().to_dict()
+
+
+@pytest.mark.parametrize("kid", [["2024-01"], {"k": 1}, 7, None, "missing"])
+def test_unknown_or_malformed_kid_is_jwt_error(ring, kid):
+    token = ".".join([b64({"alg": "RS256", "kid": kid}), b64({"sub": "a"}), "c2ln"])
+
+    with pytest.raises(JWTError):
+        ring.verification_key(token)
+
+
+@pytest.mark.anyio
+async def test_watch_reloads_added_key(ring, tmp_path):
+    watcher = asyncio.create_task(ring.watch(0.01))
+    try:
+        await asyncio.sleep(0.05)
+        write_key(tmp_path, "2024-02")
+        for _ in range(200):
+            if ring.signing_key[0] == "2024-02":
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        watcher.cancel()
+
+    assert ring.signing_key[0] == "2024-02"
+    assert set(ring.verification_keys()) == {"2024-01", "2024-02"}
+
+
+@pytest.mark.anyio
+async def test_watch_keeps_keys_when_reload_fails(ring, tmp_path):
+    version = ring.version
+    watcher = asyncio.create_task(ring.watch(0.01))
+    try:
+        await asyncio.sleep(0.05)
+        (tmp_path / "2024-02.pem").write_text("not a key")
+        await asyncio.sleep(0.1)
+    finally:
+        watcher.cancel()
+
+    assert ring.version == version
+    assert ring.signing_key[0] == "2024-01"
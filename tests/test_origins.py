@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from cor_auth.conf.config import Settings
+from cor_auth.services import origins
+from cor_auth.services.origins import OriginPolicy
+
+PATTERNS = [
+    "https://cor-medical.ua",
+    "https://*.cor-medical.ua",
+    "http://*.dev.cor-medical.ua:8080",
+    "http://localhost:3000/",
+]
+
+
+@pytest.fixture
+def policy():
+    return OriginPolicy(PATTERNS)
+
+
+@pytest.mark.parametrize(
+    "origin",
+    [
+        "https://cor-medical.ua",
+        "HTTPS://Cor-Medical.UA",
+        "http://localhost:3000",
+        "https://app.cor-medical.ua",
+        "https://a.b.c.cor-medical.ua",
+        "http://api.dev.cor-medical.ua:8080",
+        "https://api.dev.cor-medical.ua",
+    ],
+)
+def test_allowed(policy, origin):
+    assert policy.allows_origin(origin)
+
+
+@pytest.mark.parametrize(
+    "origin",
+    [
+        # Схема и порт должны совпадать с шаблоном
+        "http://cor-medical.ua",
+        "http://app.cor-medical.ua",
+        "https://app.cor-medical.ua:8443",
+        "https://cor-medical.ua:443",
+        "http://localhost:3001",
+        "https://localhost:3000",
+        "http://api.dev.cor-medical.ua",
+        "http://dev.cor-medical.ua:8080",
+        # Похожие домены
+        "https://evilcor-medical.ua",
+        "https://app.evilcor-medical.ua",
+        "https://cor-medical.ua.evil.com",
+        "https://app.cor-medical.ua.evil.com",
+        "https://cor-medical.uaa",
+        # Сам домен шаблона "*." и пустая метка
+        "https://.cor-medical.ua",
+        "null",
+        "",
+    ],
+)
+def test_rejected(policy, origin):
+    assert not policy.allows_origin(origin)
+
+
+@pytest.mark.parametrize(
+    "url, allowed",
+    [
+        ("https://app.cor-medical.ua/callback?x=1", True),
+        ("https://cor-medical.ua", True),
+        ("https://user@app.cor-medical.ua/", False),
+        ("javascript://app.cor-medical.ua/%0aalert(1)", False),
+        ("//app.cor-medical.ua/callback", False),
+        ("https://evilcor-medical.ua/callback", False),
+        ("https://[::1/", False),
+    ],
+)
+def test_allows_url(policy, url, allowed):
+    assert policy.allows_url(url) is allowed
+
+
+def test_invalid_patterns_are_ignored():
+    policy = OriginPolicy(["cor-medical.ua", "ftp://*.cor-medical.ua", "https://ok.ua"])
+
+    assert policy.allows_origin("https://ok.ua")
+    assert not policy.allows_origin("ftp://a.cor-medical.ua")
+
+
+def test_reload_swaps_rules(policy):
+    policy.reload(["https://*.example.com"])
+
+    assert policy.patterns == ("https://*.example.com",)
+    assert policy.allows_origin("https://a.example.com")
+    assert not policy.allows_origin("https://app.cor-medical.ua")
+
+
+@pytest.mark.anyio
+async def test_watch_reloads_env_file(policy, tmp_path, monkeypatch):
+    env_file = tmp_path / ".env"
+    env_file.write_text("ALLOWED_REDIRECT_URLS=[\"https://cor-medical.ua\"]\n")
+    monkeypatch.setitem(Settings.model_config, "env_file", str(env_file))
+    monkeypatch.delenv("ALLOWED_REDIRECT_URLS", raising=False)
+    monkeypatch.setattr(origins.settings, "allowed_redirect_urls", PATTERNS)
+
+    watcher = asyncio.create_task(policy.watch(0.01))
+    try:
+        await asyncio.sleep(0.05)
+        env_file.write_text("ALLOWED_REDIRECT_URLS=[\"https://*.example.com\"]\n")
+        for _ in range(200):
+            if policy.patterns == ("https://*.example.com",):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        watcher.cancel()
+
+    assert policy.allows_origin("https://a.example.com")
+    assert not policy.allows_origin("https://app.cor-medical.ua")
+    assert origins.settings.allowed_redirect_urls == ["https://*.example.com"]
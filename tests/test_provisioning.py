@@ -0,0 +1,127 @@
+import io
+import json
+
+import pytest
+from sqlalchemy import event, select
+
+from cor_auth.database.models import Bootstrap, Role, User
+from cor_auth.repository import users as repository_users
+from cor_auth.schemas import UserModel
+from cor_auth.services.provisioning import import_users, read_rows
+
+pytestmark = pytest.mark.anyio
+
+# bcrypt с минимальной стоимостью: строки с password_hash не уходят в пул хеширования
+HASH = "$2b$04$hbTJp0OpnP/6oJw.LOkfr.hlXoA/T6bkzQLFs4R0z2NCwXofwDEVS"
+
+
+def ndjson(*rows) -> io.StringIO:
+    return io.StringIO("".join(json.dumps(row) + "\n" for row in rows))
+
+
+async def test_wrong_field_types_are_row_errors():
+    rows = read_rows(
+        ndjson(
+            {"email": 42, "password_hash": HASH},
+            {"email": ["a@example.com"], "password_hash": HASH},
+            {"email": "b@example.com", "password": 12345678},
+            {"email": "c@example.com", "password_hash": {"hash": HASH}},
+            {"email": "d@example.com", "password_hash": HASH, "role": ["admin"]},
+        ),
+        "ndjson",
+    )
+
+    # Ни одна строка не дошла до базы, поэтому сессия не нужна
+    report = await import_users(rows, db=None)
+
+    assert report["created"] == 0
+    assert report["errors"] == [
+        {"line": 1, "error": "email must be a string"},
+        {"line": 2, "error": "email must be a string"},
+        {"line": 3, "error": "password must be a string"},
+        {"line": 4, "error": "password_hash must be a string"},
+        {"line": 5, "error": "role must be a string"},
+    ]
+
+
+async def test_import_claims_bootstrap_flag(db):
+    rows = read_rows(
+        ndjson(
+            {"email": "bad@example.com", "password": 12345678},
+            {"email": "staff@example.com", "password_hash": HASH, "role": "user"},
+            {"email": "first@example.com", "password_hash": HASH},
+            {"email": "second@example.com", "password_hash": HASH},
+        ),
+        "ndjson",
+    )
+
+    report = await import_users(rows, db)
+
+    assert report["created"] == 3
+    assert report["errors"] == [{"line": 1, "error": "password must be a string"}]
+    roles = dict((await db.execute(select(User.email, User.role))).all())
+    assert roles == {
+        "staff@example.com": Role.user,
+        "first@example.com": Role.admin,
+        "second@example.com": Role.user,
+    }
+    assert await db.scalar(select(Bootstrap.admin_claimed))
+    signup = await repository_users.create_user(UserModel(email="new@example.com", password="hashed"), db)
+    assert signup.role == Role.user
+
+
+async def test_imported_admin_claims_bootstrap_flag(db):
+    rows = read_rows(
+        ndjson(
+            {"email": "first@example.com", "password_hash": HASH},
+            {"email": "boss@example.com", "password_hash": HASH, "role": "admin"},
+        ),
+        "ndjson",
+    )
+
+    await import_users(rows, db)
+
+    roles = dict((await db.execute(select(User.email, User.role))).all())
+    assert roles == {"first@example.com": Role.user, "boss@example.com": Role.admin}
+    assert await db.scalar(select(Bootstrap.admin_claimed))
+
+
+async def test_explicit_roles_leave_bootstrap_flag_free(db):
+    rows = read_rows(
+        ndjson(
+            {"email": "staff@example.com", "password_hash": HASH, "role": "user"},
+            {"email": "guest@example.com", "password_hash": HASH, "role": "user"},
+        ),
+        "ndjson",
+    )
+
+    await import_users(rows, db)
+
+    # Администратор не создан, поэтому флаг достаётся следующей регистрации
+    assert not await db.scalar(select(Bootstrap.admin_claimed))
+    signup = await repository_users.create_user(UserModel(email="new@example.com", password="hashed"), db)
+    assert signup.role == Role.admin
+
+
+async def test_import_is_one_statement(db):
+    statements = []
+    engine = db.bind.sync_engine
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("INSERT INTO users"):
+            statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        rows = read_rows(
+            ndjson(*({"email": f"u{i}@example.com", "password_hash": HASH} for i in range(50))),
+            "ndjson",
+        )
+        report = await import_users(rows, db)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert report["created"] == 50
+    assert len(statements) == 1
+    roles = dict((await db.execute(select(User.email, User.role))).all())
+    assert roles["u0@example.com"] == Role.admin
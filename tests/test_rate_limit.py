@@ -0,0 +1,120 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import fakeredis
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from cor_auth.repository import users as repository_users  # noqa: F401  (импортируется до services.auth)
+from cor_auth.database.db import get_db
+from cor_auth.routes import auth
+from cor_auth.services import rate_limit, redis_client
+from cor_auth.services.rate_limit import LoginThrottle, MemoryRateLimiter, RedisRateLimiter
+
+pytestmark = pytest.mark.anyio
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Окна начинаются на кратных 60 секундах; подменяем оба источника времени только в rate_limit
+    clock = Clock(6000.0)
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+@pytest.fixture(params=["memory", "redis"])
+def limiter(request, clock, monkeypatch):
+    if request.param == "memory":
+        return MemoryRateLimiter(window=60)
+    monkeypatch.setattr(
+        redis_client, "_client", fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    )
+    return RedisRateLimiter(window=60)
+
+
+async def test_limit_within_window(limiter, clock):
+    for _ in range(3):
+        assert await limiter.hit("k", 3) == 0
+
+    clock.now += 15
+
+    assert await limiter.hit("k", 3) == 45
+    assert await limiter.hit("other", 3) == 0
+
+
+async def test_rejected_attempts_are_not_counted(limiter, clock):
+    for _ in range(2):
+        await limiter.hit("k", 2)
+    for _ in range(10):
+        assert await limiter.hit("k", 2)
+
+    clock.now += 120
+
+    assert await limiter.hit("k", 2) == 0
+
+
+async def test_previous_window_slides_out(limiter, clock):
+    for _ in range(4):
+        await limiter.hit("k", 4)
+
+    # Середина следующего окна: из предыдущего учитывается половина, 4 * 0.5 = 2
+    clock.now += 90
+    assert await limiter.hit("k", 4) == 0
+    assert await limiter.hit("k", 4) == 0
+    assert await limiter.hit("k", 4) == 30
+
+    # Ещё через окно предыдущее окно полностью не учитывается
+    clock.now += 60
+    assert await limiter.hit("k", 4) == 0
+
+
+async def test_memory_evicts_idle_keys(clock):
+    limiter = MemoryRateLimiter(window=60, evict_every=2)
+    await limiter.hit("idle", 5)
+    clock.now += 180
+    await limiter.hit("active", 5)
+
+    assert list(limiter._counters) == ["active"]
+
+
+async def test_throttle_per_ip_and_per_email(clock):
+    throttle = LoginThrottle(MemoryRateLimiter(window=60), per_email=2, per_ip=3)
+
+    assert await throttle.check("a@example.com", "10.0.0.1") == 0
+    assert await throttle.check("A@Example.com", "10.0.0.2") == 0
+    # Третья попытка на тот же email с любого адреса отклоняется
+    assert await throttle.check("a@example.com", "10.0.0.3") == 60
+
+    assert await throttle.check("b@example.com", "10.0.0.1") == 0
+    assert await throttle.check("c@example.com", "10.0.0.1") == 0
+    # Четвёртая попытка с одного IP отклоняется, даже для нового email
+    assert await throttle.check("d@example.com", "10.0.0.1") == 60
+    assert await throttle.check("d@example.com", None) == 0
+
+
+def test_login_returns_retry_after(clock, monkeypatch):
+    monkeypatch.setattr(
+        auth, "login_throttle", LoginThrottle(MemoryRateLimiter(window=60), per_email=1, per_ip=100)
+    )
+    monkeypatch.setattr(auth.repository_users, "get_user_by_email", AsyncMock(return_value=None))
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api")
+    app.dependency_overrides[get_db] = lambda: None
+    client = TestClient(app)
+    form = {"username": "a@example.com", "password": "secret1"}
+
+    assert client.post("/api/auth/login", data=form).status_code == 404
+    clock.now += 20.5
+    response = client.post("/api/auth/login", data=form)
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "40"
@@ -0,0 +1,100 @@
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+from sqlalchemy import select, update
+
+from cor_auth.database import db as db_module
+from cor_auth.database.db import RecentWrites, RoutingSession
+from cor_auth.database.models import User
+from cor_auth.services import redis_client
+
+pytestmark = pytest.mark.anyio
+
+PREFIX = "recent-write:"
+
+
+@pytest.fixture
+def replica(monkeypatch):
+    replica = SimpleNamespace(sync_engine=object())
+    monkeypatch.setattr(db_module, "replica_engines", [replica])
+    monkeypatch.setattr(db_module, "_replica_cycle", iter(lambda: replica, None))
+    return replica
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    monkeypatch.setattr(redis_client, "_client", client)
+    return client
+
+
+async def test_mark_is_seen_by_other_workers(replica, redis):
+    # Два экземпляра с общим Redis — как два воркера или два пода
+    writer = RecentWrites(window=5, prefix=PREFIX)
+    reader = RecentWrites(window=5, prefix=PREFIX)
+    user_id = uuid.uuid4()
+
+    await writer.mark(user_id, "user@example.com")
+
+    assert await reader.pinned(user_id)
+    assert await reader.pinned("other@example.com", "user@example.com")
+    assert not await reader.pinned(uuid.uuid4())
+    assert 0 < await redis.pttl(PREFIX + str(user_id)) <= 5000
+
+
+async def test_shared_mark_expires(replica, redis):
+    writer = RecentWrites(window=0.05, prefix=PREFIX)
+    reader = RecentWrites(window=0.05, prefix=PREFIX)
+    await writer.mark("user@example.com")
+
+    await asyncio.sleep(0.1)
+
+    assert not await reader.pinned("user@example.com")
+    assert not await writer.pinned("user@example.com")
+
+
+async def test_process_local_marks_without_prefix(replica, redis):
+    writer = RecentWrites(window=5)
+    reader = RecentWrites(window=5)
+    await writer.mark("user@example.com")
+
+    assert await writer.pinned("user@example.com")
+    assert not await reader.pinned("user@example.com")
+    assert await redis.dbsize() == 0
+
+
+async def test_redis_failure_reads_primary(replica, monkeypatch):
+    class Down:
+        def __getattr__(self, name):
+            raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(redis_client, "_client", Down())
+    writes = RecentWrites(window=5, prefix=PREFIX)
+
+    await writes.mark("user@example.com")
+
+    assert await writes.pinned("user@example.com")
+    assert await writes.pinned("unknown@example.com")
+
+
+async def test_no_replicas_no_marks(redis):
+    writes = RecentWrites(window=5, prefix=PREFIX)
+    await writes.mark("user@example.com")
+
+    assert not await writes.pinned("user@example.com")
+    assert await redis.dbsize() == 0
+
+
+def test_routing_session(replica):
+    session = RoutingSession()
+    primary = db_module.async_engine.sync_engine
+
+    assert session.get_bind(clause=select(User)) is replica.sync_engine
+    assert session.get_bind(clause=select(User).with_for_update()) is primary
+    assert session.get_bind(clause=select(User), primary=True) is primary
+    assert session.get_bind(clause=update(User).values(role="admin")) is primary
+    # После записи сессия читает только с основного сервера
+    assert session.get_bind(clause=select(User)) is primary
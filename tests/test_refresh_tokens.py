@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy import select, update
+
+from cor_auth.database.db import get_db
+from cor_auth.database.models import RefreshToken, User
+from cor_auth.repository import tokens as repository_tokens
+from cor_auth.routes import auth
+from cor_auth.services.auth import auth_service
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client(db):
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api")
+    app.dependency_overrides[get_db] = lambda: db
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        yield client
+
+
+@pytest.fixture
+async def token(db):
+    user = User(email="user@example.com", password="hashed")
+    db.add(user)
+    await db.commit()
+    token = await auth_service.create_refresh_token()
+    family_id, token_hash = await auth_service.decode_refresh_token(token)
+    await repository_tokens.create_refresh_token(
+        user.id, family_id, token_hash, auth_service.refresh_token_expires_at(), db
+    )
+    return token
+
+
+async def refresh(client, token):
+    return await client.get(
+        "/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"}
+    )
+
+
+async def revoked(db) -> bool:
+    return await db.scalar(select(RefreshToken.revoked_at.is_not(None)))
+
+
+async def test_rotation(client, db, token):
+    first = await refresh(client, token)
+    second = await refresh(client, first.json()["refresh_token"])
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["refresh_token"] != token
+    assert second.json()["refresh_token"] != first.json()["refresh_token"]
+    assert not await revoked(db)
+
+
+async def test_concurrent_refresh_gets_same_token(client, db, token):
+    # Две вкладки обновляют токен одновременно: проигравшая гонку получает тот же новый токен
+    first = await refresh(client, token)
+    second = await refresh(client, token)
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["refresh_token"] == second.json()["refresh_token"]
+    assert not await revoked(db)
+    assert (await refresh(client, second.json()["refresh_token"])).status_code == 200
+
+
+async def test_reuse_after_grace_period_revokes_family(client, db, token):
+    successor = (await refresh(client, token)).json()["refresh_token"]
+    await db.execute(
+        update(RefreshToken).values(issued_at=datetime.now(timezone.utc) - timedelta(minutes=1))
+    )
+    await db.commit()
+
+    assert (await refresh(client, token)).status_code == 401
+    assert await revoked(db)
+    assert (await refresh(client, successor)).status_code == 401
+
+
+async def test_reuse_of_older_token_revokes_family(client, db, token):
+    successor = (await refresh(client, token)).json()["refresh_token"]
+    await refresh(client, successor)
+
+    # Токен двумя поколениями раньше текущего — это уже не гонка вкладок
+    assert (await refresh(client, token)).status_code == 401
+    assert await revoked(db)
+
+
+async def test_grace_period_disabled(client, db, token, monkeypatch):
+    monkeypatch.setattr(auth.settings, "refresh_token_grace_period", 0)
+    await refresh(client, token)
+
+    assert (await refresh(client, token)).status_code == 401
+    assert await revoked(db)
+
+
+def test_successor_is_deterministic():
+    token = "a" * 32 + ".secret"
+    successor = auth_service.successor_refresh_token(token)
+
+    assert successor == auth_service.successor_refresh_token(token)
+    assert successor.startswith("a" * 32 + ".")
+    assert successor != auth_service.successor_refresh_token("a" * 32 + ".other")
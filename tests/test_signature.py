@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+from cor_auth.middleware.signature import SignatureVerificationMiddleware, verify_signature
+
+pytestmark = pytest.mark.anyio
+
+KEY = b"test-signing-key"
+MAX_BODY_SIZE = 1024
+
+
+async def echo(request: Request) -> Response:
+    return Response(await request.body(), media_type="application/octet-stream")
+
+
+def make_app(calls: list | None = None) -> SignatureVerificationMiddleware:
+    async def endpoint(request: Request) -> Response:
+        if calls is not None:
+            calls.append(request)
+        return await echo(request)
+
+    app = Starlette(routes=[Route("/echo", endpoint, methods=["POST"])])
+    return SignatureVerificationMiddleware(app, key=KEY, max_body_size=MAX_BODY_SIZE)
+
+
+def sign(body: bytes) -> str:
+    return hmac.new(KEY, body, hashlib.sha256).hexdigest()
+
+
+async def post(app, chunks: list[bytes], headers: dict[str, str]) -> tuple[int, bytes, int]:
+    """Drives the ASGI app with the body split into chunks; returns status, body and unread chunks."""
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/echo",
+        "raw_path": b"/echo",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        "client": ("127.0.0.1", 1234),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    status = sent[0]["status"]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return status, body, len(messages)
+
+
+def test_verify_signature():
+    assert verify_signature(b"payload", sign(b"payload"), KEY)
+    assert not verify_signature(b"payload", sign(b"other"), KEY)
+
+
+async def test_valid_signature_reaches_route():
+    body = b'{"email": "user@cor-medical.ua"}'
+    status, response, _ = await post(make_app(), [body], {"X-Signature": sign(body)})
+    assert status == 200
+    assert response == body
+
+
+async def test_chunked_body_is_replayed_to_route():
+    chunks = [b"a" * 100, b"b" * 200, b"c" * 300]
+    body = b"".join(chunks)
+    status, response, _ = await post(make_app(), chunks, {"X-Signature": sign(body)})
+    assert status == 200
+    assert response == body
+
+
+async def test_bad_signature_is_rejected():
+    calls = []
+    body = b"payload"
+    status, response, _ = await post(make_app(calls), [body], {"X-Signature": sign(b"tampered")})
+    assert status == 401
+    assert b"Invalid signature" in response
+    assert calls == []
+
+
+async def test_missing_signature_is_rejected():
+    calls = []
+    status, _, _ = await post(make_app(calls), [b"payload"], {})
+    assert status == 401
+    assert calls == []
+
+
+async def test_declared_oversized_body_is_rejected_before_reading():
+    chunks = [b"x" * 512, b"x" * 1024]
+    body = b"".join(chunks)
+    status, response, unread = await post(
+        make_app(),
+        chunks,
+        {"X-Signature": sign(body), "Content-Length": str(len(body))},
+    )
+    assert status == 413
+    assert b"too large" in response
+    assert unread == len(chunks)
+
+
+async def test_streamed_oversized_body_is_rejected_at_the_limit():
+    calls = []
+    chunks = [b"x" * 600, b"x" * 600, b"x" * 600]
+    body = b"".join(chunks)
+    status, _, unread = await post(make_app(calls), chunks, {"X-Signature": sign(body)})
+    assert status == 413
+    assert unread == 1
+    assert calls == []
+
+
+async def test_body_at_the_limit_is_accepted():
+    body = b"x" * MAX_BODY_SIZE
+    status, response, _ = await post(make_app(), [body], {"X-Signature": sign(body)})
+    assert status == 200
+    assert response == body
+
+
+async def test_disabled_middleware_passes_through():
+    app = make_app()
+    app.enabled = False
+    status, response, _ = await post(app, [b"payload"], {})
+    assert status == 200
+    assert response == b"payload"
@@ -0,0 +1,75 @@
+import gzip
+
+import brotli
+import pytest
+from starlette.datastructures import Headers
+
+from cor_auth.services import static_assets as static_assets_module
+from cor_auth.services.static_assets import StaticAssets
+
+CSS = ".button { color: #123456; }\n" * 50
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / "styles.css").write_text(CSS)
+    (tmp_path / "login.html").write_text('<link href="/static/styles.css">' + "<p>x</p>" * 100)
+    assets = StaticAssets(str(tmp_path))
+    assets.load()
+    return assets
+
+
+def get(assets, name, **headers):
+    return assets.response(name, Headers(headers))
+
+
+def test_brotli_variant_is_served(assets):
+    response = get(assets, "styles.css", **{"accept-encoding": "gzip, deflate, br"})
+
+    assert response.headers["Content-Encoding"] == "br"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"].endswith('-br"')
+    assert brotli.decompress(response.body).decode() == CSS
+
+
+def test_gzip_when_brotli_not_accepted(assets):
+    response = get(assets, "styles.css", **{"accept-encoding": "gzip, br;q=0"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.body).decode() == CSS
+
+
+def test_identity_without_accept_encoding(assets):
+    response = get(assets, "styles.css")
+
+    assert "Content-Encoding" not in response.headers
+    assert response.body.decode() == CSS
+
+
+def test_etag_revalidation_per_encoding(assets):
+    etag = get(assets, "styles.css", **{"accept-encoding": "br"}).headers["ETag"]
+
+    assert get(assets, "styles.css", **{"accept-encoding": "br", "if-none-match": etag}).status_code == 304
+    assert get(assets, "styles.css", **{"accept-encoding": "gzip", "if-none-match": etag}).status_code == 200
+
+
+def test_html_references_are_fingerprinted(assets):
+    fingerprinted = assets.fingerprints["styles.css"]
+    page = get(assets, "login.html").body.decode()
+    response = get(assets, fingerprinted, **{"accept-encoding": "br"})
+
+    assert f'href="/static/{fingerprinted}"' in page
+    assert "immutable" in response.headers["Cache-Control"]
+    assert response.headers["Content-Encoding"] == "br"
+
+
+def test_warns_without_brotli(tmp_path, monkeypatch, caplog):
+    (tmp_path / "styles.css").write_text(CSS)
+    monkeypatch.setattr(static_assets_module, "brotli", None)
+    assets = StaticAssets(str(tmp_path))
+
+    with caplog.at_level("WARNING", logger=static_assets_module.logger.name):
+        assets.load()
+
+    assert "brotli is not installed" in caplog.text
+    assert get(assets, "styles.css", **{"accept-encoding": "br, gzip"}).headers["Content-Encoding"] == "gzip"
@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import select
+
+from cor_auth.database.models import Bootstrap, Role, User
+from cor_auth.repository import users as repository_users
+from cor_auth.schemas import UserModel
+
+pytestmark = pytest.mark.anyio
+
+
+def body(email: str) -> UserModel:
+    return UserModel(email=email, password="hashed")
+
+
+async def admin_claimed(db) -> bool:
+    return await db.scalar(select(Bootstrap.admin_claimed).where(Bootstrap.id == 1))
+
+
+async def test_first_user_becomes_admin(db):
+    first = await repository_users.create_user(body("first@example.com"), db)
+    second = await repository_users.create_user(body("second@example.com"), db)
+
+    assert first.role == Role.admin
+    assert second.role == Role.user
+    assert await admin_claimed(db)
+
+
+async def test_duplicate_email_does_not_claim_flag(db):
+    # Пользователь есть, а флаг свободен: например, база заполнена до миграции bootstrap
+    db.add(User(email="taken@example.com", password="hashed", role=Role.user))
+    await db.commit()
+
+    duplicate = await repository_users.create_user(body("taken@example.com"), db)
+
+    assert duplicate is None
+    assert not await admin_claimed(db)
+    new_user = await repository_users.create_user(body("new@example.com"), db)
+    assert new_user.role == Role.admin
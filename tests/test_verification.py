@@ -0,0 +1,139 @@
+import asyncio
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from cor_auth.conf.config import Settings
+from cor_auth.services import redis_client, verification
+from cor_auth.services.verification import MemoryVerificationStore, RedisVerificationStore
+
+pytestmark = pytest.mark.anyio
+
+EMAIL = "user@example.com"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    # Подменяется модуль time только внутри verification: часы цикла событий не трогаем
+    monkeypatch.setattr(verification, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(server=fakeredis.FakeServer())
+    monkeypatch.setattr(redis_client, "_client", client)
+    return client
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, clock):
+    if request.param == "memory":
+        return MemoryVerificationStore(ttl=60, max_attempts=3)
+    request.getfixturevalue("redis")
+    return RedisVerificationStore(ttl=60, max_attempts=3)
+
+
+async def test_correct_code_is_consumed(store):
+    await store.issue(EMAIL, 123456)
+
+    assert await store.verify(EMAIL, 123456)
+    assert not await store.verify(EMAIL, 123456)
+
+
+async def test_unknown_email(store):
+    assert not await store.verify(EMAIL, 123456)
+
+
+async def test_new_code_replaces_previous(store):
+    await store.issue(EMAIL, 111111)
+    await store.issue(EMAIL, 222222)
+
+    assert not await store.verify(EMAIL, 111111)
+    assert await store.verify(EMAIL, 222222)
+
+
+async def test_code_dropped_after_max_attempts(store):
+    await store.issue(EMAIL, 123456)
+
+    assert not await store.verify(EMAIL, 1)
+    assert not await store.verify(EMAIL, 2)
+    # Верный код после исчерпания попыток уже не принимается
+    assert not await store.verify(EMAIL, 3)
+    assert not await store.verify(EMAIL, 123456)
+
+
+async def test_reissue_resets_attempts(store):
+    await store.issue(EMAIL, 123456)
+    assert not await store.verify(EMAIL, 1)
+    assert not await store.verify(EMAIL, 2)
+
+    await store.issue(EMAIL, 123456)
+
+    assert not await store.verify(EMAIL, 3)
+    assert await store.verify(EMAIL, 123456)
+
+
+async def test_memory_code_expires(clock):
+    store = MemoryVerificationStore(ttl=60, max_attempts=3)
+    await store.issue(EMAIL, 123456)
+
+    clock.now += 61
+
+    assert not await store.verify(EMAIL, 123456)
+
+
+async def test_memory_purges_expired_codes(clock):
+    store = MemoryVerificationStore(ttl=60, max_attempts=3, purge_every=2)
+    await store.issue("old@example.com", 1)
+    clock.now += 61
+    await store.issue(EMAIL, 2)
+
+    assert list(store._codes) == [EMAIL]
+
+
+async def test_redis_code_has_ttl(redis):
+    store = RedisVerificationStore(ttl=60, max_attempts=3)
+    await store.issue(EMAIL, 123456)
+
+    assert 0 < await redis.ttl(store.prefix + EMAIL) <= 60
+
+
+async def test_redis_code_expires(redis):
+    store = RedisVerificationStore(ttl=1, max_attempts=3)
+    await store.issue(EMAIL, 123456)
+
+    await asyncio.sleep(1.1)
+
+    assert not await redis.exists(store.prefix + EMAIL)
+    assert not await store.verify(EMAIL, 123456)
+
+
+async def test_redis_attempts_are_shared(redis):
+    # Два экземпляра хранилища — как два воркера с общим Redis
+    first = RedisVerificationStore(ttl=60, max_attempts=2)
+    second = RedisVerificationStore(ttl=60, max_attempts=2)
+    await first.issue(EMAIL, 123456)
+
+    assert not await first.verify(EMAIL, 1)
+    assert not await second.verify(EMAIL, 2)
+    assert not await first.verify(EMAIL, 123456)
+
+
+def test_backend_setting(monkeypatch):
+    # Коды в памяти не видны другим воркерам, поэтому по умолчанию используется Redis
+    assert Settings.model_fields["verification_backend"].default == "redis"
+    monkeypatch.setattr(verification.settings, "verification_backend", "redis")
+    assert isinstance(verification.create_verification_store(), RedisVerificationStore)
+    monkeypatch.setattr(verification.settings, "verification_backend", "memory")
+    assert isinstance(verification.create_verification_store(), MemoryVerificationStore)